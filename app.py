@@ -1,14 +1,25 @@
+import datetime
+import logging
+import uuid
 import streamlit as st
-from PIL import Image
 from dotenv import load_dotenv
 
 # 분리한 모듈 임포트
 import config
-import utils
 import services
+import uploads
+import batch
+import quota
+import dispatch
+import metrics
+import styles
+import jobs
+import history
+from cache import make_key
 
 # 환경 변수 로드
 load_dotenv()
+logging.basicConfig(level=logging.INFO)
 
 # 페이지 설정
 st.set_page_config(page_title=config.PAGE_TITLE, page_icon=config.PAGE_ICON)
@@ -18,10 +29,29 @@ if "daily_result" not in st.session_state:
     st.session_state.daily_result = None
 if "notice_result" not in st.session_state:
     st.session_state.notice_result = None
+# 공지사항 결과가 양식으로 만든 것이면 그 양식 이름 (AI로 다시 쓰면 None)
+if "notice_template" not in st.session_state:
+    st.session_state.notice_template = None
+if "batch_results" not in st.session_state:
+    st.session_state.batch_results = None
+# 진행 중인 백그라운드 생성 작업 id (재실행돼도 작업은 계속 돌아감)
+for job_state_key in ("daily_job", "notice_job", "batch_job"):
+    if job_state_key not in st.session_state:
+        st.session_state[job_state_key] = None
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+session_id = st.session_state.session_id
+job_manager = jobs.get_job_manager()
 
 # --- 사용량 제한 체크 ---
-usage_data = utils.get_usage_counter()
-utils.check_and_reset_usage(usage_data)
+quota_store = quota.get_quota_store()
+# 사용자별 한도용 식별자 (Streamlit 버전에 따라 없을 수 있음)
+client_id = getattr(st.context, "ip_address", None)
+if not isinstance(client_id, str):
+    client_id = None
+
+# --- 말투 프로필 ---
+style_store = styles.get_style_store()
 
 # --- Gemini API 설정 ---
 api_key = services.configure_genai()
@@ -32,14 +62,146 @@ api_key = services.configure_genai()
 st.sidebar.title(f"{config.PAGE_ICON} {config.PAGE_TITLE}")
 
 # 메뉴 선택
-menu = st.sidebar.radio("메뉴 선택", ["📝 알림장 (개인)", "📢 공지사항 (전체)"])
+menu = st.sidebar.radio("메뉴 선택", ["📝 알림장 (개인)", "📚 알림장 (반 전체)", "📢 공지사항 (전체)"], key="menu")
+
+# 선생님별 말투 프로필
+profile_id = st.sidebar.text_input(
+    "👩‍🏫 선생님 이름 (말투 프로필)", value=config.DEFAULT_STYLE_PROFILE, key="style_profile"
+).strip() or config.DEFAULT_STYLE_PROFILE
+style_profile = style_store.get(profile_id)
+# 프롬프트에는 원문 대신 토큰 예산 안으로 줄인 요약본만 넣음
+style_excerpt = style_profile["excerpt"] if style_profile else ""
+
+def record_style_savings():
+    """요청 1건에서 말투 요약본으로 아낀 토큰 수를 기록합니다."""
+    if style_profile:
+        metrics.record(
+            notice_type="daily",
+            stage="style",
+            style_tokens=style_profile["excerpt_tokens"],
+            style_tokens_saved=style_profile["content_tokens"] - style_profile["excerpt_tokens"]
+        )
 
 st.sidebar.markdown("---")
-st.sidebar.markdown(f"📊 **오늘 생성 횟수:** {usage_data['count']} / {config.DAILY_LIMIT}")
+st.sidebar.markdown(f"📊 **오늘 생성 횟수:** {quota_store.count()} / {config.DAILY_LIMIT}")
+cache_stats = services.get_cache_stats()
+st.sidebar.caption(f"♻️ 캐시 적중 {cache_stats['hits']}회 / 미스 {cache_stats['misses']}회 ({cache_stats['hit_rate']:.0%})")
+
+with st.sidebar.expander("📈 성능 지표 (관리자)"):
+    metric_rows = metrics.histogram.summary()
+    if metric_rows:
+        st.table(metric_rows)
+    else:
+        st.caption("아직 기록된 요청이 없습니다.")
+    model_rows = services.get_model_stats()
+    if model_rows:
+        st.caption("모델별 최근 지연·오류율")
+        st.table(model_rows)
+
+# --- 지난 기록 (API 호출 없이 다시 쓰기) ---
+HISTORY_PAGES = {"daily": ("📝 알림장 (개인)", "daily_result"), "public": ("📢 공지사항 (전체)", "notice_result")}
+
+def use_history(row):
+    """지난 기록을 해당 메뉴의 결과로 불러옵니다."""
+    page, result_key = HISTORY_PAGES[row["notice_type"]]
+    st.session_state.menu = page
+    st.session_state[result_key] = row["text"]
+    st.session_state.notice_template = None
+
+# HISTORY_DB_PATH가 None이면 기록을 쓰지 않으므로 지난 기록 화면도 숨김.
+# 기본 프로필은 이름을 바꾸지 않은 모든 방문자가 같이 쓰므로 그 기록도 보여주지 않음
+if config.HISTORY_DB_PATH and profile_id != config.DEFAULT_STYLE_PROFILE:
+    with st.sidebar.expander("🗂️ 지난 기록"):
+        history_query = st.text_input("검색 (키워드·본문)", key="history_query")
+        # 키셋 페이지네이션: 페이지마다 앞 페이지 마지막 id를 쌓아 둠 (검색어·선생님이 바뀌면 처음부터)
+        if st.session_state.get("history_cursor_query") != (profile_id, history_query):
+            st.session_state.history_cursor_query = (profile_id, history_query)
+            st.session_state.history_cursors = [None]
+        cursors = st.session_state.history_cursors
+        # 지금 선생님(말투 프로필)이 만든 기록만 보여줌
+        history_rows = history.get_history_store().page(
+            history_query, before_id=cursors[-1], limit=config.HISTORY_PAGE_SIZE + 1, owner=profile_id
+        )
+        has_next = len(history_rows) > config.HISTORY_PAGE_SIZE
+        history_rows = history_rows[:config.HISTORY_PAGE_SIZE]
+        if not history_rows:
+            st.caption("기록이 없습니다.")
+        for row in history_rows:
+            created = datetime.datetime.fromtimestamp(row["created_at"]).strftime("%m/%d %H:%M")
+            st.markdown(f"**{'📝' if row['notice_type'] == 'daily' else '📢'} {created}** · {row['keywords'][:30]}")
+            st.caption(row["text"][:80] + ("…" if len(row["text"]) > 80 else ""))
+            st.button("불러오기", key=f"history_use_{row['id']}", on_click=use_history, args=(row,))
+        col_prev, col_next = st.columns(2)
+        col_prev.button("◀ 이전", key="history_prev", disabled=len(cursors) == 1, on_click=cursors.pop)
+        col_next.button(
+            "다음 ▶", key="history_next", disabled=not has_next,
+            on_click=cursors.append, args=(history_rows[-1]["id"] if history_rows else None,)
+        )
 
 if not api_key:
     st.sidebar.error("⚠️ .env 파일에 API 키를 설정해주세요.")
 
+def stream_job(stream_fn, **kwargs):
+    """스트리밍 생성을 작업 스레드에서 실행하는 함수를 만듭니다 (사용량 차감·환불 포함).
+
+    한도는 여기서만 확인합니다. 캐시 적중(과 그 전에 처리되는 공지사항 양식)은 API를 쓰지 않으므로
+    한도를 다 쓴 뒤에도 돌려주고, 캐시에 없어 모델을 부르기 직전에만 차감합니다.
+    작업 스레드에서는 화면 요소를 쓰지 않고 job에 조각을 쌓기만 합니다.
+    """
+    def run(job):
+        ticket = None
+        try:
+            chunks, from_cache = stream_fn(**kwargs, on_wait=job.on_wait)
+            # 캐시 적중은 API를 호출하지 않으므로 사용량에 포함하지 않음
+            if not from_cache:
+                ticket = quota_store.try_consume(client_id)
+                if ticket is None:
+                    raise quota.QuotaExceededError()
+            for chunk in chunks:
+                job.emit(chunk)
+            return job.text
+        except Exception:
+            # 실패한 요청(대기열 초과·마감 시간 초과 포함)은 사용량에서 되돌림
+            quota_store.refund(ticket)
+            raise
+    return run
+
+def show_job(job_key, result_key):
+    """세션의 생성 작업 상태를 보여줍니다. 끝난 작업은 결과를 세션으로 옮깁니다."""
+    job = job_manager.get(st.session_state[job_key])
+    if job is None:
+        st.session_state[job_key] = None
+        return
+    if job.finished:
+        st.session_state[job_key] = None
+        if job.error is None:
+            st.session_state[result_key] = job.result
+        elif isinstance(job.error, dispatch.DispatchError):
+            st.warning(str(job.error))
+        elif isinstance(job.error, quota.QuotaExceededError):
+            st.error(str(job.error))
+        else:
+            st.error(f"오류가 발생했습니다: {job.error}")
+        return
+
+    # 진행 중인 동안에는 이 부분만 주기적으로 다시 그림 (다른 위젯은 계속 쓸 수 있음)
+    @st.fragment(run_every=config.JOB_POLL_SECONDS)
+    def poll():
+        if job.finished:
+            st.rerun()
+        if job.progress:
+            done, total = job.progress
+            st.progress(done / total, text=f"{done} / {total} 완료")
+            for failure in job.failures:
+                st.caption(f"🔴 {failure}")
+        elif job.text:
+            st.markdown(job.text)
+        elif job.wait_position:
+            st.info(f"⏳ 요청이 많아 잠시 기다리고 있어요... (대기 순번 {job.wait_position})")
+        else:
+            st.info("✍️ 작성하고 있어요...")
+    poll()
+
 # ==========================================
 # [메인 화면 구성]
 # ==========================================
@@ -53,7 +215,7 @@ if menu == "📝 알림장 (개인)":
     with st.expander("🎨 나만의 말투 설정 (클릭해서 열기)", expanded=False):
         st.info("평소 쓰시는 알림장 문구를 적어주시면 AI가 선생님의 말투를 따라합니다.")
         
-        saved_style_content = utils.load_style()
+        saved_style_content = style_profile["content"] if style_profile else ""
         
         new_style_content = st.text_area(
             "말투 예시 입력", 
@@ -66,28 +228,56 @@ if menu == "📝 알림장 (개인)":
         with col1:
             if st.button("💾 말투 저장하기"):
                 if new_style_content.strip():
-                    if utils.save_style(new_style_content):
+                    try:
+                        style_store.save(profile_id, new_style_content)
                         st.success("말투가 저장되었습니다!")
                         st.rerun()
+                    except Exception as e:
+                        st.error(f"말투 저장에 실패했습니다: {e}")
         with col2:
             if saved_style_content:
                 if st.button("🗑️ 말투 초기화"):
-                    if utils.remove_style():
+                    if style_store.delete(profile_id):
                         st.rerun()
 
-    if saved_style_content:
-        st.success(f"🟢 현재 **나만의 말투**가 적용되어 있습니다.")
+    if style_profile:
+        st.success(
+            f"🟢 현재 **{profile_id}** 선생님의 말투가 적용되어 있습니다. "
+            f"(예시 {style_profile['content_tokens']}토큰 → 요약 {style_profile['excerpt_tokens']}토큰)"
+        )
     
     st.markdown("---")
 
     # --- 사진 및 키워드 입력 ---
     uploaded_files = st.file_uploader("활동 사진 (여러 장 가능)", type=["jpg", "png", "jpeg"], accept_multiple_files=True)
-    
-    if uploaded_files:
-        cols = st.columns(min(3, len(uploaded_files)))
-        for idx, uploaded_file in enumerate(uploaded_files):
+
+    # 새로 올라온 사진만 한 번 디코딩해 썸네일과 전송용 이미지를 만들고, 원본은 임시 폴더로 옮김
+    if "daily_uploads" not in st.session_state:
+        st.session_state.daily_uploads = uploads.UploadSession()
+    upload_session = st.session_state.daily_uploads
+    with st.spinner("사진을 준비하고 있어요..."):
+        failed = upload_session.sync(uploaded_files or [])
+    for idx, err in failed:
+        st.warning(f"사진 {idx+1}을(를) 읽지 못해 제외했습니다: {err}")
+
+    # 연속 촬영한 비슷한 사진은 묶음마다 가장 선명한 1장만 보냄
+    dedup = st.toggle("비슷한 사진은 가장 선명한 1장만 보내기", value=True, key="dedup_toggle")
+    send_photos, dropped_photos = upload_session.select() if dedup else (upload_session.photos, [])
+
+    if upload_session.photos:
+        photo_numbers = {id(photo): idx + 1 for idx, photo in enumerate(upload_session.photos)}
+        replaced_by = {id(photo): photo_numbers[id(best)] for photo, best in dropped_photos}
+        cols = st.columns(min(3, len(upload_session.photos)))
+        for idx, photo in enumerate(upload_session.photos):
+            caption = f"사진 {idx+1}"
+            if id(photo) in replaced_by:
+                caption += f" · 비슷해서 제외 (사진 {replaced_by[id(photo)]} 사용)"
             with cols[idx % 3]:
-                st.image(uploaded_file, caption=f"사진 {idx+1}", use_container_width=True)
+                st.image(photo.preview, caption=caption, use_container_width=True)
+    if dropped_photos:
+        saved_tokens = len(dropped_photos) * config.IMAGE_TOKENS
+        saved_kb = sum(photo.image_bytes for photo, _ in dropped_photos) / 1024
+        st.caption(f"♻️ 비슷한 사진 {len(dropped_photos)}장을 빼고 보냅니다 (약 {saved_tokens}토큰, {saved_kb:.0f} KB 절약)")
 
     keywords = st.text_input("활동 키워드 (예: 모래놀이, 웃음)", key="input_daily")
 
@@ -95,30 +285,53 @@ if menu == "📝 알림장 (개인)":
     col_btn, col_toggle = st.columns([3, 1])
     use_emoji = col_toggle.toggle("이모티콘 사용", value=True, key="emoji_daily_toggle")
     
-    if col_btn.button("✨ 알림장 생성", key="daily_btn"):
+    generate_clicked = col_btn.button("✨ 알림장 생성", key="daily_btn")
+    # 같은 입력이면 캐시된 결과가 돌아오므로, 새 문장이 필요할 때는 캐시를 건너뜀
+    regenerate_clicked = bool(st.session_state.daily_result) and st.button("🔄 다시 생성", key="daily_regen_btn")
+
+    if generate_clicked or regenerate_clicked:
         if not api_key:
              st.error("API 키가 설정되지 않았습니다.")
         elif not uploaded_files or not keywords:
             st.error("사진과 키워드를 모두 입력해주세요.")
-        elif usage_data["count"] >= config.DAILY_LIMIT:
-            st.error("오늘의 생성 한도를 초과했습니다.")
         else:
-            with st.spinner("알림장을 작성하고 있어요..."):
-                try:
-                    # PIL 이미지 객체로 변환
-                    images = [Image.open(f) for f in uploaded_files]
-                    
-                    result_text = services.generate_daily_notice(
-                        images=images,
-                        keywords=keywords,
-                        style_content=saved_style_content,
-                        use_emoji=use_emoji
-                    )
-                    
-                    st.session_state.daily_result = result_text
-                    usage_data["count"] += 1
-                except Exception as e:
-                    st.error(f"오류가 발생했습니다: {e}")
+            try:
+                # 전송용 이미지는 업로드 때 만들어 둠 (다시 생성이면 임시 폴더의 원본에서 다시 만듦)
+                photos = upload_session.model_images(send_photos)
+                if not photos:
+                    raise ValueError("사용할 수 있는 사진이 없습니다.")
+                # 같은 입력으로 진행 중인 작업이 있으면 새로 보내지 않고 그 작업을 이어서 보여줌
+                job_key = make_key(
+                    "daily", profile_id, keywords, style_excerpt, str(use_emoji), str(regenerate_clicked),
+                    digests=[photo.path for photo in send_photos]
+                )
+                job, created = job_manager.submit(session_id, job_key, "daily", stream_job(
+                    services.stream_daily_notice,
+                    images=photos,
+                    keywords=keywords,
+                    style_content=style_excerpt,
+                    use_emoji=use_emoji,
+                    use_cache=not regenerate_clicked,
+                    owner=profile_id
+                ))
+                if created:
+                    record_style_savings()
+                    if dropped_photos:
+                        metrics.record(
+                            notice_type="daily",
+                            stage="dedup",
+                            images_dropped=len(dropped_photos),
+                            image_tokens_saved=len(dropped_photos) * config.IMAGE_TOKENS,
+                            image_bytes_saved=sum(photo.image_bytes for photo, _ in dropped_photos)
+                        )
+                st.session_state.daily_job = job.job_id
+            except Exception as e:
+                st.error(f"오류가 발생했습니다: {e}")
+            finally:
+                # 작업이 이미지 목록을 들고 있으므로 세션 쪽은 썸네일만 남김
+                upload_session.release()
+
+    show_job("daily_job", "daily_result")
 
     # 결과 표시
     if st.session_state.daily_result:
@@ -126,7 +339,96 @@ if menu == "📝 알림장 (개인)":
         st.success("따뜻한 알림장이 완성되었습니다!")
         st.code(st.session_state.daily_result, language="text", wrap_lines=True)
 
-# --- 2. 공지사항 (전체) ---
+# --- 2. 알림장 (반 전체) ---
+elif menu == "📚 알림장 (반 전체)":
+    st.title("📚 반 전체 알림장")
+    st.subheader("명단과 사진을 올리면 아이별 알림장을 한 번에 작성합니다.")
+    st.info("명단 CSV에는 **이름, 키워드, 사진** 열이 필요합니다. 사진 열에는 zip 안의 경로(폴더가 있으면 `민수/1.jpg`처럼)를 `;`로 구분해 적어주세요.")
+
+    roster_file = st.file_uploader("명단 CSV", type=["csv"], key="batch_roster")
+    photo_zip = st.file_uploader("사진 묶음 (zip)", type=["zip"], key="batch_photos")
+
+    col_btn, col_toggle = st.columns([3, 1])
+    use_emoji_batch = col_toggle.toggle("이모티콘 사용", value=True, key="emoji_batch_toggle")
+
+    if col_btn.button("✨ 반 전체 알림장 생성", key="batch_btn"):
+        if not api_key:
+             st.error("API 키가 설정되지 않았습니다.")
+        elif not roster_file or not photo_zip:
+            st.error("명단 CSV와 사진 zip을 모두 올려주세요.")
+        else:
+            try:
+                items = batch.load_roster(roster_file)
+                photos = batch.read_photo_zip(photo_zip)
+            except Exception as e:
+                items = []
+                st.error(f"명단/사진을 읽지 못했습니다: {e}")
+
+            if items:
+                def run_batch_job(
+                    job, items=items, photos=photos, style=style_excerpt, use_emoji=use_emoji_batch, owner=profile_id
+                ):
+                    ticket = quota_store.try_consume(client_id, amount=len(items))
+                    if ticket is None:
+                        remaining = quota_store.remaining(client_id)
+                        raise quota.QuotaExceededError(
+                            f"오늘 남은 생성 횟수({remaining}회)보다 명단 인원({len(items)}명)이 많습니다."
+                        )
+                    job.progress = (0, len(items))
+                    used = 0
+
+                    def on_progress(done, total, result):
+                        job.progress = (done, total)
+                        if not result.ok:
+                            job.add_failure(f"{result.name}: {result.error} ({result.attempts}회 시도)")
+
+                    try:
+                        results = batch.run_batch(
+                            items, photos,
+                            style_content=style,
+                            use_emoji=use_emoji,
+                            on_progress=on_progress,
+                            owner=owner
+                        )
+                        used = sum(1 for r in results if r.ok and not r.from_cache)
+                        return results
+                    finally:
+                        # 인원수만큼 미리 잡아둔 사용량 중 실패·캐시 적중분은 되돌림
+                        quota_store.refund(ticket[used:])
+
+                job_key = make_key(
+                    "batch", profile_id, style_excerpt, str(use_emoji_batch),
+                    getattr(roster_file, "file_id", roster_file.name), getattr(photo_zip, "file_id", photo_zip.name)
+                )
+                job, _ = job_manager.submit(session_id, job_key, "batch", run_batch_job)
+                st.session_state.batch_job = job.job_id
+
+    show_job("batch_job", "batch_results")
+
+    # 결과 표시
+    if st.session_state.batch_results:
+        results = st.session_state.batch_results
+        succeeded = sum(1 for r in results if r.ok)
+        retried = sum(1 for r in results if r.attempts > 1)
+        st.divider()
+        st.success(f"{len(results)}명 중 {succeeded}명의 알림장이 완성되었습니다!")
+        if retried:
+            st.caption(f"🔁 {retried}명은 일시적인 오류로 다시 시도했어요.")
+        st.download_button(
+            "📦 결과 내려받기 (zip)",
+            data=batch.build_bundle(results),
+            file_name="알림장_반전체.zip",
+            mime="application/zip"
+        )
+        for result in results:
+            attempts = f" ({result.attempts}회 시도)" if result.attempts > 1 else ""
+            with st.expander(f"{'🟢' if result.ok else '🔴'} {result.name}{attempts}"):
+                if result.ok:
+                    st.code(result.text, language="text", wrap_lines=True)
+                else:
+                    st.error(result.error)
+
+# --- 3. 공지사항 (전체) ---
 elif menu == "📢 공지사항 (전체)":
     st.title("📢 학부모님 전체 공지사항")
     st.subheader("중요한 내용을 정중하고 따뜻하게 전달합니다.")
@@ -137,30 +439,50 @@ elif menu == "📢 공지사항 (전체)":
     col_btn, col_toggle = st.columns([3, 1])
     use_emoji_notice = col_toggle.toggle("이모티콘 사용", value=True, key="emoji_notice_toggle")
     
-    if col_btn.button("✨ 공지사항 생성", key="notice_btn"):
+    generate_clicked = col_btn.button("✨ 공지사항 생성", key="notice_btn")
+
+    # 자주 쓰는 공지는 양식으로 바로 채움 (API 호출·사용량 없음). 모델 생성은 "AI로 다시 쓰기"를 누를 때만
+    template = None
+    if generate_clicked and notice_keywords:
+        template = services.fill_public_template(notice_keywords, use_emoji_notice, owner=profile_id)
+        if template:
+            st.session_state.notice_result = template.text
+            st.session_state.notice_template = template.label
+            st.session_state.notice_job = None
+
+    from_template = bool(st.session_state.notice_result) and st.session_state.notice_template is not None
+    rewrite_clicked = from_template and st.button("✨ AI로 다시 쓰기", key="notice_rewrite_btn")
+    regenerate_clicked = (
+        bool(st.session_state.notice_result) and not from_template
+        and st.button("🔄 다시 생성", key="notice_regen_btn")
+    )
+
+    if (generate_clicked and template is None) or rewrite_clicked or regenerate_clicked:
         if not api_key:
              st.error("API 키가 설정되지 않았습니다.")
         elif not notice_keywords:
             st.error("공지 내용을 입력해주세요.")
-        elif usage_data["count"] >= config.DAILY_LIMIT:
-            st.error("오늘의 생성 한도를 초과했습니다.")
         else:
-            with st.spinner("공지사항을 다듬고 있어요..."):
-                try:
-                    result_text = services.generate_public_notice(
-                        notice_keywords=notice_keywords,
-                        use_emoji=use_emoji_notice
-                    )
-                    
-                    st.session_state.notice_result = result_text
-                    usage_data["count"] += 1
-                except Exception as e:
-                    st.error(f"오류가 발생했습니다: {e}")
+            job_key = make_key("public", profile_id, notice_keywords, str(use_emoji_notice), str(regenerate_clicked))
+            job, _ = job_manager.submit(session_id, job_key, "public", stream_job(
+                services.stream_public_notice,
+                notice_keywords=notice_keywords,
+                use_emoji=use_emoji_notice,
+                use_cache=not regenerate_clicked,
+                owner=profile_id
+            ))
+            st.session_state.notice_job = job.job_id
+            st.session_state.notice_template = None
+
+    show_job("notice_job", "notice_result")
 
     # 결과 표시
     if st.session_state.notice_result:
         st.divider()
-        st.success("공지사항이 작성되었습니다!")
+        if st.session_state.notice_template:
+            st.success(f"📋 자주 쓰는 '{st.session_state.notice_template}' 양식으로 바로 만들었어요. 내용을 확인해 주세요!")
+        else:
+            st.success("공지사항이 작성되었습니다!")
         st.code(st.session_state.notice_result, language="text", wrap_lines=True)
 
 # CSS 스타일링 (버튼 등)
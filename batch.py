@@ -0,0 +1,202 @@
+import csv
+import io
+import logging
+import os
+import random
+import re
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+import dispatch
+import images
+import services
+from config import BATCH_CONCURRENCY, BATCH_MAX_RETRIES, BATCH_RETRY_BASE_SECONDS, BATCH_MAX_PHOTO_BYTES
+
+logger = logging.getLogger(__name__)
+
+# 명단 CSV 열 이름
+ROSTER_COLUMNS = ("이름", "키워드", "사진")
+
+# zip 안 파일명에 쓸 수 없는 문자 (경로 구분자 포함)
+_UNSAFE_FILENAME = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+@dataclass
+class BatchItem:
+    """반 전체 생성의 아이 한 명분 입력."""
+    name: str
+    keywords: str
+    photo_names: List[str] = field(default_factory=list)
+
+@dataclass
+class BatchResult:
+    """아이 한 명분 생성 결과."""
+    name: str
+    text: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    from_cache: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+def _check_photos(names: List[str], sizes: List[int], max_bytes: int) -> None:
+    """같은 경로의 사진이 둘이거나 전체 용량이 max_bytes를 넘으면 ValueError를 냅니다."""
+    duplicates = sorted(name for name, count in Counter(names).items() if count > 1)
+    if duplicates:
+        raise ValueError(f"같은 경로의 사진이 여러 개 있습니다: {', '.join(duplicates)}")
+    total = sum(sizes)
+    if total > max_bytes:
+        raise ValueError(
+            f"사진 용량({total / 1024 / 1024:.0f}MB)이 최대 {max_bytes / 1024 / 1024:.0f}MB를 넘습니다."
+        )
+
+def read_photo_zip(zip_file: BinaryIO, max_bytes: int = BATCH_MAX_PHOTO_BYTES) -> Dict[str, bytes]:
+    """사진 zip 파일을 {zip 안 경로: 바이트}로 읽습니다 (예: "민수/1.jpg").
+
+    아이별 폴더에 같은 파일명이 있어도 섞이지 않도록 폴더 경로까지 키로 씁니다.
+    압축을 풀기 전에 헤더의 원래 크기 합을 max_bytes와 비교합니다.
+    """
+    with zipfile.ZipFile(zip_file) as zf:
+        # macOS가 넣는 리소스 포크 폴더는 사진이 아님
+        infos = [
+            info for info in zf.infolist()
+            if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+        ]
+        names = [info.filename.replace("\\", "/").strip("/") for info in infos]
+        _check_photos(names, [info.file_size for info in infos], max_bytes)
+        return {name: zf.read(info) for name, info in zip(names, infos)}
+
+def read_photo_dir(path: str, max_bytes: int = BATCH_MAX_PHOTO_BYTES) -> Dict[str, bytes]:
+    """사진 폴더를 하위 폴더까지 {폴더 기준 경로: 바이트}로 읽습니다 (zip과 같은 "민수/1.jpg" 형식)."""
+    files = []
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            file_path = os.path.join(root, filename)
+            files.append((os.path.relpath(file_path, path).replace(os.sep, "/"), file_path))
+    _check_photos([name for name, _ in files], [os.path.getsize(p) for _, p in files], max_bytes)
+    photos = {}
+    for name, file_path in files:
+        with open(file_path, "rb") as f:
+            photos[name] = f.read()
+    return photos
+
+def load_roster(csv_file: BinaryIO) -> List[BatchItem]:
+    """명단 CSV(이름, 키워드, 사진)를 읽습니다. 사진 열은 zip 안 경로("민수/1.jpg")를 ';'로 구분합니다."""
+    text = csv_file.read()
+    if isinstance(text, bytes):
+        text = text.decode("utf-8-sig")
+    reader = csv.DictReader(io.StringIO(text))
+    missing = [col for col in ROSTER_COLUMNS if col not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"명단 CSV에 다음 열이 없습니다: {', '.join(missing)}")
+
+    items = []
+    for row in reader:
+        name = (row["이름"] or "").strip()
+        if not name:
+            continue
+        photo_names = [p.strip() for p in (row["사진"] or "").split(";") if p.strip()]
+        items.append(BatchItem(name=name, keywords=(row["키워드"] or "").strip(), photo_names=photo_names))
+    return items
+
+def _generate_item(
+    item: BatchItem,
+    photos: Dict[str, bytes],
+    style_content: str,
+    use_emoji: bool,
+    max_retries: int,
+    owner: str = ""
+) -> BatchResult:
+    result = BatchResult(name=item.name)
+    try:
+        missing = [p for p in item.photo_names if p not in photos]
+        if missing:
+            raise ValueError(f"사진을 찾을 수 없습니다: {', '.join(missing)}")
+        # 바깥 풀이 이미 아이 단위로 병렬이므로 사진은 순서대로 처리
+        blobs, failed = images.preprocess_images([io.BytesIO(photos[p]) for p in item.photo_names], max_workers=1)
+        if failed or not blobs:
+            raise ValueError("사진을 읽지 못했습니다.")
+    except Exception as e:
+        result.error = str(e)
+        return result
+
+    while True:
+        result.attempts += 1
+        try:
+            result.text, result.from_cache = services.generate_daily_notice(
+                images=blobs,
+                keywords=f"(아이 이름: {item.name}) {item.keywords}",
+                style_content=style_content,
+                use_emoji=use_emoji,
+                owner=owner
+            )
+            result.error = None
+            return result
+        except Exception as e:
+            result.error = str(e)
+            # 429/5xx는 라우터(대체 모델)와 디스패처(백오프)가 이미 재시도했으므로 여기서 또 보내면
+            # 한도에 걸린 때 요청만 늘어남. 보내 보지도 못한 대기열 가득 참만 다시 시도
+            if not isinstance(e, dispatch.QueueFullError) or result.attempts > max_retries:
+                logger.warning("%s 알림장 생성 실패 (%d회 시도): %s", item.name, result.attempts, e)
+                return result
+            # 지수 백오프 + 지터
+            time.sleep(BATCH_RETRY_BASE_SECONDS * (2 ** (result.attempts - 1)) * random.uniform(0.5, 1.5))
+
+def run_batch(
+    items: List[BatchItem],
+    photos: Dict[str, bytes],
+    style_content: str,
+    use_emoji: bool,
+    max_concurrency: int = BATCH_CONCURRENCY,
+    max_retries: int = BATCH_MAX_RETRIES,
+    on_progress: Optional[Callable[[int, int, BatchResult], None]] = None,
+    owner: str = ""
+) -> List[BatchResult]:
+    """아이별 알림장을 최대 max_concurrency개씩 동시에 생성합니다.
+
+    한 아이의 실패는 나머지에 영향을 주지 않습니다. on_progress는 호출한 스레드에서
+    (완료 수, 전체 수, 결과)로 불리므로 Streamlit 화면 갱신에 바로 쓸 수 있습니다.
+    결과는 명단 순서대로 반환합니다.
+    """
+    results: List[Optional[BatchResult]] = [None] * len(items)
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(items)))) as pool:
+        futures = {
+            pool.submit(_generate_item, item, photos, style_content, use_emoji, max_retries, owner): idx
+            for idx, item in enumerate(items)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            idx = futures[future]
+            results[idx] = future.result()
+            if on_progress:
+                on_progress(done, len(items), results[idx])
+    return results
+
+def _safe_filename(name: str) -> str:
+    """아이 이름을 zip 안 파일명으로 쓸 수 있게 바꿉니다 ("a/../b" 같은 경로 탈출 방지)."""
+    return _UNSAFE_FILENAME.sub("_", name).strip(". ") or "이름없음"
+
+def build_bundle(results: List[BatchResult]) -> bytes:
+    """결과를 아이별 txt + 요약 CSV가 담긴 zip으로 묶습니다."""
+    summary = io.StringIO()
+    writer = csv.writer(summary)
+    writer.writerow(["이름", "상태", "시도 횟수", "알림장", "오류"])
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for idx, result in enumerate(results, start=1):
+            writer.writerow([
+                result.name, "성공" if result.ok else "실패", result.attempts,
+                result.text or "", result.error or ""
+            ])
+            if result.ok:
+                zf.writestr(f"{idx:02d}_{_safe_filename(result.name)}.txt", result.text)
+        # 엑셀에서 한글이 깨지지 않도록 BOM 포함
+        zf.writestr("results.csv", "\ufeff" + summary.getvalue())
+    return buf.getvalue()
@@ -0,0 +1,892 @@
+"""가짜 Gemini 백엔드로 돌리는 오프라인 성능 벤치마크.
+
+사용법:
+    python -m benchmark                         # 모든 시나리오
+    python -m benchmark single burst --quick    # 일부 시나리오, 짧게
+    python -m benchmark -o bench.json --baseline old.json
+
+결과는 JSON으로 출력되며, --baseline으로 이전 커밋의 결과와 처리량·p95를 비교합니다.
+"""
+import argparse
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from PIL import Image
+
+import batch
+import dispatch
+import fake_gemini
+import history
+import images
+import jobs
+import metrics
+import routing
+import services
+import styles
+import templates
+import uploads
+from cache import ResponseCache
+from quota import QuotaStore
+
+# 기본 가짜 모델 프로필 (--quick이면 지연을 1/10로 줄임)
+DEFAULT_PROFILE = {"latency": 1.2, "jitter": 0.2, "ttft": 0.4, "chunk_interval": 0.05, "error_rate": 0.0}
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "p50": round(pick(0.50), 1),
+        "p95": round(pick(0.95), 1),
+        "p99": round(pick(0.99), 1),
+        "mean": round(statistics.fmean(ordered), 1),
+    }
+
+def synthetic_photo(seed: int, size=(4032, 3024)) -> bytes:
+    """휴대폰 사진 크기의 합성 JPEG를 만듭니다 (작은 노이즈를 확대해 사진처럼 부드럽게)."""
+    small = (size[0] // 8, size[1] // 8)
+    bands = [Image.effect_noise(small, 40 + seed % 20 + i * 5) for i in range(3)]
+    img = Image.merge("RGB", bands).resize(size, Image.BICUBIC)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+class Bench:
+    """시나리오 실행 환경. 실제 data/ 디렉토리는 건드리지 않습니다."""
+
+    def __init__(self, quick: bool, profile: Dict[str, float]):
+        self.quick = quick
+        scale = 0.1 if quick else 1.0
+        self.profile = {k: (v * scale if k in ("latency", "ttft", "chunk_interval") else v) for k, v in profile.items()}
+        self.tmpdir = tempfile.mkdtemp(prefix="notice-bench-")
+        self._photos: Dict[tuple, bytes] = {}
+
+    def reset(self, models=None, routes=None, **overrides) -> metrics.HistogramSink:
+        """가짜 모델·캐시·디스패처·라우터·계측을 새로 끼웁니다. models는 모델명별 프로필 덮어쓰기."""
+        services.set_model_factory(fake_gemini.make_factory(models=models, **{**self.profile, **overrides}))
+        routing.set_router(routing.ModelRouter(routes=routes))
+        services.response_cache = ResponseCache(disk_dir=None)
+        dispatch.set_dispatcher(dispatch.Dispatcher(backoff_base=0.05, backoff_max=0.5))
+        histogram = metrics.HistogramSink()
+        metrics.set_recorder(metrics.Recorder([histogram]))
+        history.set_history_store(history.HistoryStore(os.path.join(self.tmpdir, "history.db")))
+        return histogram
+
+    def photo(self, seed: int, size=(4032, 3024)) -> bytes:
+        key = (seed, size)
+        if key not in self._photos:
+            self._photos[key] = synthetic_photo(seed, size)
+        return self._photos[key]
+
+    def n(self, full: int, quick: int) -> int:
+        return quick if self.quick else full
+
+def timed(fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+# --- 시나리오 ---
+
+def scenario_single(bench: Bench) -> Dict[str, object]:
+    """공지사항 1건씩 순서대로 생성."""
+    bench.reset()
+    count = bench.n(20, 5)
+    latencies = [
+        timed(lambda i=i: services.generate_public_notice(f"{i}일 금요일 생일파티, 10시 시작", True, use_cache=False))
+        for i in range(count)
+    ]
+    return {"requests": count, "latency_ms": percentiles(latencies)}
+
+def scenario_multi_photo(bench: Bench) -> Dict[str, object]:
+    """12MP 사진 여러 장 + 키워드로 알림장 생성 (전처리 포함)."""
+    histogram = bench.reset()
+    count, photo_count = bench.n(5, 2), bench.n(5, 3)
+    raw = [bench.photo(i) for i in range(photo_count)]
+    style = styles.build_excerpt("오늘은 우리 아이들이 블록 놀이를 했어요! 친구와 함께 높은 탑을 쌓았답니다~ " * 40)
+    latencies = []
+    for i in range(count):
+        def run():
+            photos, _ = images.preprocess_images([io.BytesIO(data) for data in raw])
+            services.generate_daily_notice(photos, f"모래놀이 {i}", style, True, use_cache=False)
+        latencies.append(timed(run))
+    return {
+        "requests": count,
+        "photos_per_request": photo_count,
+        "raw_bytes": sum(len(data) for data in raw),
+        "sent_bytes": round(histogram.percentile("daily", "image_bytes", 0.5) or 0),
+        "preprocess_ms": round(histogram.percentile("daily", "preprocess_ms", 0.5) or 0, 1),
+        "latency_ms": percentiles(latencies),
+    }
+
+def scenario_burst(bench: Bench) -> Dict[str, object]:
+    """여러 세션이 동시에 스트리밍 생성 (429 10% 섞음)."""
+    bench.reset(error_rate=0.1)
+    sessions = bench.n(30, 10)
+    latencies, ttfts, errors = [], [], []
+    lock = threading.Lock()
+
+    def session(i):
+        start = time.perf_counter()
+        first = None
+        try:
+            chunks, _ = services.stream_public_notice(f"{i}번 공지: 다음 주 현장학습", True, use_cache=False)
+            for _ in chunks:
+                if first is None:
+                    first = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+                ttfts.append(first)
+        except Exception as e:
+            with lock:
+                errors.append(type(e).__name__)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": sessions,
+        "errors": len(errors),
+        "throughput_rps": round(sessions / elapsed, 2),
+        "latency_ms": percentiles(latencies),
+        "ttft_ms": percentiles(ttfts),
+        "dispatcher": dispatch.get_dispatcher().stats(),
+    }
+
+def scenario_batch(bench: Bench) -> Dict[str, object]:
+    """반 전체(아이 20명 × 사진 2장) 일괄 생성."""
+    bench.reset()
+    children = bench.n(20, 6)
+    photos = {f"{i}.jpg": bench.photo(i, (2016, 1512)) for i in range(children * 2)}
+    items = [
+        batch.BatchItem(name=f"아이{i}", keywords="블록 놀이", photo_names=[f"{2 * i}.jpg", f"{2 * i + 1}.jpg"])
+        for i in range(children)
+    ]
+    start = time.perf_counter()
+    results = batch.run_batch(items, photos, style_content="", use_emoji=True)
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": children,
+        "errors": sum(1 for r in results if not r.ok),
+        "throughput_rps": round(children / elapsed, 2),
+        "total_ms": round(elapsed * 1000, 1),
+    }
+
+def scenario_preprocess(bench: Bench) -> Dict[str, object]:
+    """사진 전처리: 순차 vs 스레드 풀 (1/5/10/20장)."""
+    bench.reset()
+    counts = (1, 5, 10) if bench.quick else (1, 5, 10, 20)
+    raw = [bench.photo(i % 5) for i in range(max(counts))]
+    report = {}
+    for n in counts:
+        sources = lambda: [io.BytesIO(data) for data in raw[:n]]
+        serial = timed(lambda: images.preprocess_images(sources(), max_workers=1))
+        parallel = timed(lambda: images.preprocess_images(sources()))
+        report[str(n)] = {"serial_ms": round(serial, 1), "parallel_ms": round(parallel, 1), "speedup": round(serial / parallel, 2)}
+    return report
+
+def scenario_rerun(bench: Bench) -> Dict[str, object]:
+    """Streamlit 재실행 1회마다 반복되는 준비 작업 비용 (말투 프로필 로드, 모델 준비)."""
+    import google.generativeai as genai
+
+    reruns = bench.n(2000, 300)
+    style = "오늘은 우리 아이들이 블록 놀이를 했어요! " * 40
+    # 앱처럼 스레드마다 연결을 여는 저장소 (캐시 없이 매번 읽기 vs 메모리 캐시)
+    uncached = styles.StyleProfileStore(os.path.join(bench.tmpdir, "styles-rerun.db"), cache_size=0)
+    profile_id = styles.DEFAULT_STYLE_PROFILE
+    uncached.save(profile_id, style)
+    store = styles.StyleProfileStore(uncached.path)
+
+    services.set_model_factory(None)
+    per_call = lambda fn: round(timed(lambda: [fn() for _ in range(reruns)]) * 1000 / reruns, 2)
+    previous_key = os.environ.get("GOOGLE_API_KEY")
+    os.environ["GOOGLE_API_KEY"] = "benchmark-key"
+    try:
+        return {
+            "reruns": reruns,
+            "style_read_us": per_call(lambda: uncached.get(profile_id)),
+            "style_cached_us": per_call(lambda: store.get(profile_id)),
+            "configure_every_us": per_call(lambda: genai.configure(api_key="benchmark-key")),
+            "configure_cached_us": per_call(services.configure_genai),
+            "model_new_us": per_call(lambda: genai.GenerativeModel(services.MODEL_NAME)),
+            "model_registry_us": per_call(services.get_model),
+        }
+    finally:
+        if previous_key is None:
+            os.environ.pop("GOOGLE_API_KEY", None)
+        else:
+            os.environ["GOOGLE_API_KEY"] = previous_key
+
+# 시스템 지침으로 나누기 전의 알림장 프롬프트 (비교용)
+_LEGACY_DAILY_PROMPT = """
+당신은 다정한 어린이집 선생님입니다. 사진과 키워드를 보고 학부모님께 보낼 알림장을 작성해주세요.
+키워드: {keywords}
+{style_instruction}
+
+[지침]
+1. 아주 다정하고 따뜻한 말투 ('~했어요', '~했답니다')
+2. 아이의 활동을 구체적으로 칭찬
+3. {emoji_instruction}
+4. 한국어로 작성
+"""
+
+def _common_prefix_tokens(texts: List[str]) -> int:
+    """모든 요청이 공유하는 앞부분의 토큰 수 (컨텍스트 캐시로 할인받을 수 있는 부분)."""
+    return services.estimate_tokens(os.path.commonprefix(texts))
+
+def scenario_prompt(bench: Bench) -> Dict[str, object]:
+    """프롬프트 조립 비용과 요청별 입력 토큰: 한 덩어리 프롬프트 vs 시스템 지침 + 키워드."""
+    histogram = bench.reset()
+    count = bench.n(200, 40)
+    style = styles.build_excerpt("오늘은 우리 아이들이 블록 놀이를 했어요! 친구와 함께 높은 탑을 쌓았답니다~ " * 40)
+    keywords = [f"{i}번째 날, 모래놀이와 물감놀이" for i in range(count)]
+
+    def legacy(kw):
+        return _LEGACY_DAILY_PROMPT.format(
+            keywords=kw,
+            style_instruction=f"말투 예시:\n{style}",
+            emoji_instruction=services.get_emoji_instruction(True)
+        )
+
+    def split(kw):
+        return services.build_daily_system_instruction(style, True) + services.build_daily_prompt(kw)
+
+    legacy_prompts = [legacy(kw) for kw in keywords]
+    system_instruction = services.build_daily_system_instruction(style, True)
+    for kw in keywords:
+        services.generate_daily_notice([], kw, style, True, use_cache=False)
+    # 요청 1건의 입력 토큰 (컨텍스트 캐시 할인 전): 예전 한 덩어리 프롬프트 vs 시스템 지침 + 키워드 프롬프트
+    legacy_tokens = sorted(services.estimate_tokens(prompt) for prompt in legacy_prompts)[count // 2]
+    split_tokens = round(histogram.percentile("daily", "input_tokens", 0.5) or 0)
+    return {
+        "requests": count,
+        "legacy_assemble_us": round(timed(lambda: [legacy(kw) for kw in keywords]) * 1000 / count, 2),
+        "split_assemble_us": round(timed(lambda: [split(kw) for kw in keywords]) * 1000 / count, 2),
+        "legacy_input_tokens_per_request": legacy_tokens,
+        "split_input_tokens_per_request": split_tokens,
+        "input_tokens_diff_per_request": split_tokens - legacy_tokens,
+        "legacy_shared_prefix_tokens": _common_prefix_tokens(legacy_prompts),
+        "split_shared_prefix_tokens": services.estimate_tokens(system_instruction),
+        "split_varying_tokens": services.estimate_tokens(services.build_daily_prompt(keywords[0])),
+        "models_built": len(services._models),
+    }
+
+def _legacy_preview(upload: io.BytesIO) -> None:
+    """변경 전 st.image(uploaded_file): 매 재실행마다 원본 복사 + 전체 해상도 디코딩 + 축소 + 재인코딩."""
+    data = upload.getvalue()
+    img = Image.open(io.BytesIO(data))
+    width = 1460  # Streamlit MAXIMUM_CONTENT_WIDTH
+    img = img.resize((width, int(img.height * width / img.width)), Image.BILINEAR)
+    img.save(io.BytesIO(), format="JPEG", quality=90)
+
+def _current_rss_mb() -> float:
+    """지금 시점의 RSS (MB). ru_maxrss는 최대값이라 기준선으로 쓸 수 없음."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        # /proc이 없는 플랫폼: 최대값으로 대신함 (세션당 증가분이 작게 나올 수 있음)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _upload_worker(mode: str, sessions: int, raws: List[bytes], reruns: int, spill: str, queue) -> None:
+    """한 프로세스 안에서 여러 세션이 동시에 업로드·미리보기·생성 준비를 하는 부하."""
+    # spawn된 프로세스는 Bench.reset을 거치지 않으므로 여기서도 메모리 히스토그램에만 기록
+    metrics.set_recorder(metrics.Recorder([metrics.HistogramSink()]))
+    # 세션마다 Streamlit이 들고 있는 업로드 버퍼 (양쪽 모두 같음)
+    held = [[io.BytesIO(raw) for raw in raws] for _ in range(sessions)]
+    # 사진은 부모 프로세스에서 만들어 넘기므로 기준선에 합성 과정의 메모리가 섞이지 않음
+    baseline = _current_rss_mb()
+    retained = []
+
+    def session(files):
+        if mode == "legacy":
+            for _ in range(reruns):
+                for f in files:
+                    _legacy_preview(f)
+            images.preprocess_images(files)
+            retained.append(0)
+        else:
+            upload_session = uploads.UploadSession(directory=spill)
+            for _ in range(reruns):
+                upload_session.sync(files)
+            upload_session.model_images()
+            upload_session.release()
+            retained.append(upload_session.memory_bytes())
+            upload_session.clear()
+
+    cpu = time.process_time()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(files,)) for files in held]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put({
+        "peak_rss_mb": round(peak, 1),
+        "rss_per_session_mb": round((peak - baseline) / sessions, 1),
+        "retained_kb_per_session": round(statistics.fmean(retained) / 1024, 1),
+        "cpu_s": round(time.process_time() - cpu, 2),
+        "wall_s": round(time.perf_counter() - start, 2),
+    })
+
+def scenario_uploads(bench: Bench) -> Dict[str, object]:
+    """여러 세션이 동시에 12MP 사진을 올리고 재실행하는 동안의 최대 RSS (세션별 프로세스 분리 측정)."""
+    sessions, photo_count, reruns = bench.n(6, 3), bench.n(8, 4), bench.n(5, 3)
+    ctx = multiprocessing.get_context("spawn")
+    raws = [bench.photo(i) for i in range(photo_count)]
+    result = {"sessions": sessions, "photos_per_session": photo_count, "reruns": reruns}
+    for mode in ("legacy", "managed"):
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_upload_worker, args=(mode, sessions, raws, reruns, bench.tmpdir, queue))
+        proc.start()
+        result[mode] = queue.get()
+        proc.join()
+    return result
+
+def scenario_jobs(bench: Bench) -> Dict[str, object]:
+    """백그라운드 작업: 제출이 바로 돌아오는지, 같은 요청의 중복 제출이 하나로 합쳐지는지."""
+    bench.reset()
+    manager = jobs.JobManager(max_workers=4, ttl_seconds=60)
+    sessions, repeats = bench.n(8, 4), 5
+    submit_ms, created = [], 0
+    submitted = []
+    for s in range(sessions):
+        for _ in range(repeats):
+            # 같은 세션이 재실행마다 같은 요청을 다시 보내는 상황 (세션마다 내용은 다름)
+            fn = lambda job, s=s: services.generate_public_notice(f"{s}반 소풍 안내", True, use_cache=False)[0]
+            start = time.perf_counter()
+            job, is_new = manager.submit(f"session-{s}", f"public-{s}", "public", fn)
+            submit_ms.append((time.perf_counter() - start) * 1000)
+            created += is_new
+            submitted.append(job)
+    start = time.perf_counter()
+    while not all(job.finished for job in submitted):
+        time.sleep(0.01)
+    return {
+        "submissions": len(submit_ms),
+        "jobs_run": created,
+        "coalesced": len(submit_ms) - created,
+        "submit_ms": percentiles(submit_ms),
+        "drain_s": round(time.perf_counter() - start, 3),
+        "status": manager.stats(),
+    }
+
+def scenario_history(bench: Bench) -> Dict[str, object]:
+    """생성 기록 10만 건(선생님 20명)에서 검색·페이지 넘김 지연 (FTS5 trigram + 키셋 페이지네이션)."""
+    store = history.HistoryStore(os.path.join(bench.tmpdir, "history-bench.db"))
+    total = bench.n(100_000, 20_000)
+    activities = ["모래놀이", "물감놀이", "블록 쌓기", "텃밭 가꾸기", "소풍", "생일파티", "요리 활동", "동화 듣기"]
+    names = ["하준", "서윤", "도윤", "지우", "민준", "서아", "예준", "하린"]
+    start = time.perf_counter()
+    store.record_many(
+        {
+            "notice_type": "daily" if i % 4 else "public",
+            "keywords": f"{activities[i % 8]}, {names[(i // 8) % 8]}",
+            "text": f"오늘 {names[(i // 8) % 8]}이는 {activities[i % 8]}을(를) 하며 즐거운 시간을 보냈어요. "
+                    f"기록 번호 {i}번, 친구들과 {activities[(i * 7) % 8]}도 함께 했답니다.",
+            "use_emoji": i % 2,
+            "created_at": 1_700_000_000 + i,
+            "owner": f"교사{i % 20}",
+        }
+        for i in range(total)
+    )
+    insert_s = time.perf_counter() - start
+
+    queries = {
+        "recent": "",
+        "one_term": "텃밭 가꾸기",
+        "two_terms": "생일파티 서윤",
+        "short_term": "소풍",
+        "rare": f"기록 번호 {total // 2}번",
+        "no_match": "수영장",
+        "short_no_match": "수영",
+    }
+    result = {"rows": store.count(), "tokenizer": store.tokenizer, "insert_rows_per_s": round(total / insert_s)}
+    for name, query in queries.items():
+        result[f"{name}_ms"] = percentiles([timed(lambda: store.page(query)) for _ in range(bench.n(20, 5))])
+    # 선생님 1명의 기록만 (화면의 지난 기록은 항상 owner로 거름)
+    for name in ("recent", "one_term", "short_term"):
+        result[f"owner_{name}_ms"] = percentiles([
+            timed(lambda: store.page(queries[name], owner="교사7")) for _ in range(bench.n(20, 5))
+        ])
+
+    # 첫 페이지부터 50페이지까지 이어서 넘길 때 페이지당 지연
+    cursor, page_ms = None, []
+    for _ in range(50):
+        rows = []
+        page_ms.append(timed(lambda: rows.extend(store.page("", before_id=cursor))))
+        cursor = rows[-1]["id"]
+    result["paging_ms"] = percentiles(page_ms)
+    return result
+
+def _burst_photos(scenes: int, shots: int, size) -> List[bytes]:
+    """장면마다 조금씩 어긋나고 밝기가 다른 연속 촬영 사진을 만듭니다 (마지막 컷은 흔들림)."""
+    from PIL import ImageEnhance, ImageFilter
+    result = []
+    for scene in range(scenes):
+        base = Image.open(io.BytesIO(synthetic_photo(scene, size)))
+        for shot in range(shots):
+            w, h = base.size
+            img = base.crop((shot * 8, shot * 6, w - shot * 8, h - shot * 6))
+            img = ImageEnhance.Brightness(img).enhance(1 + 0.02 * shot)
+            if shot == shots - 1:
+                img = img.filter(ImageFilter.GaussianBlur(3))
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=90)
+            result.append(buf.getvalue())
+    return result
+
+def scenario_dedup(bench: Bench) -> Dict[str, object]:
+    """50장 업로드에서 지각 해시·선명도 계산과 중복 묶기 비용, 절약되는 용량·토큰."""
+    scenes, shots = bench.n(10, 4), 5
+    raws = _burst_photos(scenes, shots, bench.n((2016, 1512), (1008, 756)))
+    loaded = [images._load(io.BytesIO(raw)) for raw in raws]
+    encoded = [len(images._encode(img)) for img in loaded]
+
+    thumbs = [images._thumbnail(img) for img in loaded]
+    prints = []
+    hash_ms = timed(lambda: prints.extend(images.fingerprint(thumb) for thumb in thumbs))
+    groups = []
+    group_ms = timed(lambda: groups.extend(images.group_duplicates([p.dhash for p in prints])))
+    kept = [max(group, key=lambda idx: prints[idx].sharpness) for group in groups]
+    dropped = [idx for group in groups for idx in group if idx not in kept]
+
+    # 천천히 움직인 연속 촬영: 이웃한 컷끼리만 threshold 이내이고 양 끝은 전혀 다른 장면
+    threshold = images.IMAGE_DEDUP_THRESHOLD
+    chain, value = [], prints[0].dhash
+    for step in range(8):
+        chain.append(value)
+        value ^= ((1 << threshold) - 1) << (step * threshold % 64)
+    distance = lambda a, b: bin(a ^ b).count("1")
+    chain_groups = images.group_duplicates(chain)
+    chain_spread = max(distance(chain[a], chain[b]) for group in chain_groups for a in group for b in group)
+    return {
+        "photos": len(raws),
+        "scenes": scenes,
+        "groups_found": len(groups),
+        "blurred_kept": sum(1 for idx in kept if idx % shots == shots - 1),
+        "fingerprint_ms_per_photo": round(hash_ms / len(raws), 3),
+        "fingerprint_ms_total": round(hash_ms, 1),
+        "group_ms": round(group_ms, 2),
+        "images_dropped": len(dropped),
+        "bytes_saved": sum(encoded[idx] for idx in dropped),
+        "tokens_saved": len(dropped) * services.IMAGE_TOKENS,
+        "chain_groups": len(chain_groups),
+        "chain_max_distance": chain_spread,
+        "failures": [f"chained burst grouped photos {chain_spread} bits apart"] if chain_spread > threshold else [],
+    }
+
+# app.py가 시작할 때 불러오는 모듈들
+_APP_MODULES = ("config", "services", "uploads", "batch", "quota", "dispatch", "metrics", "styles", "jobs", "history", "cache")
+
+_FIRST_RENDER = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.session_state["menu"] = {page!r}
+start = time.perf_counter()
+at.run()
+print(json.dumps({{
+    "render_ms": round((time.perf_counter() - start) * 1000, 1),
+    "errors": len(at.exception),
+    "pil_loaded": "PIL" in sys.modules,
+    "genai_loaded": "google.generativeai" in sys.modules,
+}}))
+"""
+
+def _child_env(**extra: str) -> Dict[str, str]:
+    """하위 인터프리터용 환경 변수. 기존 PYTHONPATH(의존성 경로일 수 있음) 앞에 저장소 폴더를 붙입니다."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    path = os.pathsep.join(p for p in (here, os.environ.get("PYTHONPATH", "")) if p)
+    return {**os.environ, "PYTHONPATH": path, **extra}
+
+def _import_profile(modules: List[str], cwd: str) -> Dict[str, object]:
+    """새 인터프리터에서 -X importtime으로 모듈을 불러와 누적 시간이 큰 순서로 정리합니다."""
+    env = _child_env()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        # 들여쓰기가 없는 줄만 (하위 import는 위 줄의 누적 시간에 포함됨). site는 인터프리터 시작 비용
+        name = parts[2][1:]
+        if name.startswith(" ") or name == "site":
+            continue
+        cumulative[name] = int(parts[1]) / 1000
+    total = sum(cumulative.get(name, 0.0) for name in modules)
+    top = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:5]
+    return {"total_ms": round(total, 1), "top_ms": {name: round(ms, 1) for name, ms in top}}
+
+def scenario_startup(bench: Bench) -> Dict[str, object]:
+    """콜드 스타트: 앱 모듈 import 시간과 화면별 첫 렌더링 시간 (매번 새 프로세스)."""
+    result = {
+        "app_imports": _import_profile(list(_APP_MODULES), bench.tmpdir),
+        # 지연 로딩 전에는 앱 시작 때 함께 불러오던 무거운 의존성
+        "eager_imports": _import_profile(list(_APP_MODULES) + ["google.generativeai", "PIL.Image"], bench.tmpdir),
+    }
+    if importlib.util.find_spec("streamlit") is None:
+        result["first_render"] = "streamlit 테스트 도구 없음"
+        return result
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = _child_env(GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY") or "benchmark")
+    pages = {"daily": "📝 알림장 (개인)", "batch": "📚 알림장 (반 전체)", "public": "📢 공지사항 (전체)"}
+    renders = {}
+    for name, page in pages.items():
+        # data/는 임시 폴더 기준으로 만들어지도록 cwd를 옮겨 실행
+        code = _FIRST_RENDER.format(app=os.path.join(here, "app.py"), page=page)
+        proc = subprocess.run(
+            [sys.executable, "-c", code], cwd=bench.tmpdir, env=env, capture_output=True, text=True, check=True
+        )
+        renders[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["first_render"] = renders
+    # 첫 화면에서 무거운 의존성을 불러오거나 오류가 나면 실패 (지연 로딩이 깨진 것)
+    result["failures"] = [
+        f"{name}: {check}"
+        for name, render in renders.items()
+        for check in ("errors", "pil_loaded", "genai_loaded") if render[check]
+    ]
+    return result
+
+def _route_requests(count: int) -> Dict[str, object]:
+    """공지사항(글만)과 알림장(사진 0~5장)을 번갈아 동시에 보내고 지연·성공률을 잽니다."""
+    photo = b"\xff\xd8" + bytes(2048)
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            if i % 2:
+                services.generate_public_notice(f"{i}번 공지: 다음 주 소풍 안내", True, use_cache=False)
+            else:
+                photos = [{"mime_type": "image/jpeg", "data": photo + bytes([i, k])} for k in range(i % 6)]
+                services.generate_daily_notice(photos, f"{i}번 모래놀이", "", True, use_cache=False)
+            return (time.perf_counter() - start) * 1000, True
+        except Exception:
+            return (time.perf_counter() - start) * 1000, False
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        outcomes = list(pool.map(one, range(count)))
+    router = routing.get_router()
+    calls: Dict[str, int] = {}
+    for row in router.stats.snapshot():
+        calls[row["model"]] = calls.get(row["model"], 0) + row["calls"]
+    ok = lambda part: [ms for ms, success in part if success]
+    return {
+        "success_rate": round(len(ok(outcomes)) / count, 3),
+        "latency_ms": percentiles(ok(outcomes)),
+        # 앞뒤 절반의 지연: 통계가 쌓인 뒤 모델 순서가 바뀌는지 확인
+        "first_half_p50_ms": percentiles(ok(outcomes[:count // 2])).get("p50"),
+        "second_half_p50_ms": percentiles(ok(outcomes[count // 2:])).get("p50"),
+        "failovers": router.failovers(),
+        "recent_calls_by_model": calls,
+    }
+
+def _route_streams(count: int) -> Dict[str, object]:
+    """공지사항을 스트리밍으로 동시에 받고, 끝까지(조각 10개) 받은 비율을 잽니다."""
+    def one(i):
+        try:
+            chunks, _ = services.stream_public_notice(f"{i}번 공지: 다음 주 소풍 안내", True, use_cache=False)
+            return sum(1 for _ in chunks)
+        except Exception:
+            return 0
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        received = list(pool.map(one, range(count)))
+    return {
+        "complete_rate": round(sum(1 for n in received if n >= 10) / count, 3),
+        "failovers": routing.get_router().failovers(),
+    }
+
+def scenario_routing(bench: Bench) -> Dict[str, object]:
+    """모델 라우팅: 한 모델 고정 vs 요청별 선택, 기본 모델이 과부하이거나 느려졌을 때 대체 모델로 넘김."""
+    count = bench.n(80, 40)
+    primary, light = services.MODEL_NAME, "gemini-2.5-flash-lite"
+    latency, ttft = bench.profile["latency"], bench.profile["ttft"]
+    # 가벼운 모델은 기본 모델보다 3배쯤 빠른 가짜 백엔드
+    backends = {light: {"latency": latency / 3, "ttft": ttft / 3}}
+    single = [routing.Route("single", (primary,))]
+    # 시간 제한·지연 예산을 가짜 모델 지연에 맞춰 줄인 기본 규칙
+    scaled = [
+        route._replace(timeout=latency * 4, latency_budget_ms=route.latency_budget_ms and latency * 2000)
+        for route in routing.load_routes()
+    ]
+    cases = {
+        "single_model": (single, {}),
+        "routed": (scaled, {}),
+        "overload_single": (single, {primary: {"error_rate": 0.6}}),
+        "overload_routed": (scaled, {primary: {"error_rate": 0.6}}),
+        # 기본 모델이 평소의 3배로 느려짐 (시간 제한 안이지만 지연 예산 초과)
+        "slow_primary_routed": (scaled, {primary: {"latency": latency * 3, "ttft": ttft * 3}}),
+    }
+    result = {"requests": count}
+    for name, (routes, models) in cases.items():
+        bench.reset(models={**backends, **models}, routes=routes)
+        result[name] = _route_requests(count)
+    # 첫 조각은 빠르지만 전체 스트림은 시간 제한보다 긴 정상 응답: 중간에 끊기거나 대체되면 안 됨
+    interval = latency * 4 / 5
+    bench.reset(models={light: {"ttft": ttft / 3, "chunk_interval": interval}}, routes=scaled)
+    result["long_stream_routed"] = _route_streams(bench.n(16, 8))
+    return result
+
+# 공지사항 입력 예시 (입력, 기대하는 양식 의도 — None이면 모델로 써야 하는 공지)
+_NOTICE_CORPUS = [
+    ("이번 주 금요일 생일파티, 10시 시작, 준비물 없음", "birthday"),
+    ("3월 20일 생일파티 11시, 생일자 민준, 서아", "birthday"),
+    ("다음 주 수요일 생일잔치 오전 10시 30분", "birthday"),
+    ("4월 생일파티 4월 25일, 준비물: 편한 옷", "birthday"),
+    ("5/17 생일 파티 있어요. 케이크는 원에서 준비합니다", "birthday"),
+    ("다음 주 화요일 어린이대공원으로 소풍, 오전 9시 30분 출발, 준비물 도시락, 물통, 모자", "field_trip"),
+    ("5월 8일 현장학습 장소: 국립과천과학관, 준비물 간식", "field_trip"),
+    ("이번 주 목요일 소방서 견학 10시", "field_trip"),
+    ("6월 3일 딸기농장으로 체험학습, 9시 출발, 준비물: 여벌옷, 장화", "field_trip"),
+    ("내일 공원 나들이, 모자 꼭 챙겨주세요", "field_trip"),
+    ("10월 9일 가을 소풍 도시락 지참", "field_trip"),
+    ("10월 3일~5일 연휴 휴원, 10월 6일 정상 등원", "closure"),
+    ("5월 1일 개원기념일 휴원", "closure"),
+    ("7월 29일부터 8월 2일까지 여름방학, 8월 5일 정상 운영", "closure"),
+    ("다음 주 월요일 휴무입니다", "closure"),
+    ("12월 25일 성탄절 쉽니다", "closure"),
+    ("3월 원비 납부 안내, 25일까지, 150,000원, 계좌이체", "fee"),
+    ("현장학습비 20,000원 3월 10일까지 납부", "fee"),
+    ("특별활동비 45,000원 이번 주 금요일까지", "fee"),
+    ("4월 교재비 납부 4월 5일까지 자동이체", "fee"),
+    ("회비 3만 원 다음 주 화요일까지", "fee"),
+    ("4월 15일 학부모 상담, 오후 2시~5시, 장소: 해님반 교실", "meeting"),
+    ("3월 8일 신입 원아 오리엔테이션 오전 10시 강당", "meeting"),
+    ("다음 주 금요일 부모 참여수업 10시, 장소 유희실", "meeting"),
+    ("5월 12일 학부모 간담회 저녁 7시", "meeting"),
+    ("다음 주부터 낮잠 이불 가져와 주세요", None),
+    ("요즘 감기가 유행이니 손 씻기 지도 부탁드려요", None),
+    ("등하원 시 차량 정차 구역을 꼭 지켜주세요", None),
+    ("이번 주 주제는 봄꽃이에요, 집에서도 꽃 이야기 나눠주세요", None),
+    ("다음 주 수요일 소풍인데 비가 오면 실내 활동으로 대체하고 우천 시 따로 연락드립니다", None),
+    ("수족구병 확진자가 발생했습니다. 증상이 있으면 등원을 자제해 주세요", None),
+    ("어린이집 평가제 결과 A등급을 받았습니다. 감사합니다", None),
+    ("새 담임 선생님을 소개합니다", None),
+    ("급식 식단표가 바뀌었어요, 알레르기 있는 친구는 알려주세요", None),
+    ("생일파티 때 개별 선물은 보내지 말아 주세요, 원에서 준비한 선물과 편지를 함께 전달할 예정입니다", None),
+    ("미세먼지가 심해 바깥놀이를 실내 놀이로 대신합니다", None),
+    ("이번 달 원비가 인상되는 이유와 세부 내역을 설명드립니다", None),
+    ("하원 시간이 4시로 변경됩니다, 사정이 있으신 분은 연락주세요", None),
+    ("현장학습 사진을 키즈노트에 올렸어요", None),
+    ("여름철 모기 기피제 사용 동의서를 보내주세요", None),
+    # 양식 단어가 있지만 취소·연기·부정으로 뜻이 뒤집히거나 양식에 없는 내용이 붙은 공지
+    ("6월 3일 소풍 취소", None),
+    ("다음 주 월요일 휴원 아님, 정상 운영", None),
+    ("5월 5일 소풍 못 가요", None),
+    ("내일 소풍, 급식 없음", None),
+    ("다음 주 화요일 소풍 10시, 우천 시 연기", None),
+    ("3월 20일 생일파티, 생일자 민준, 선물 금지", None),
+    ("5월 12일 학부모 상담 일정 변경", None),
+    ("금요일 생일파티는 안 해요", None),
+    ("10월 9일 소풍 대신 실내 놀이", None),
+    # 양식 칸에 들어가지 않는 내용(행선지·준비물·복장·안내 등)이 붙은 공지: 빠뜨리지 않도록 모델로
+    ("5월 3일 소풍 어린이대공원으로", None),
+    ("금요일 소풍 10시 출발 도시락 지참", None),
+    ("금요일 생일파티 잠옷 입고 등원", None),
+    ("5월 3일 소풍 우천시 실내활동", None),
+    ("금요일 상담 10시 전화로", None),
+    ("내일 견학 소방서", None),
+    # 한 칸에 값이 둘: 하나를 버리면 틀린 공지가 되므로 모델로
+    ("5월 1일, 5월 8일 휴원", None),
+    ("5월 1일 휴원, 5월 2일 휴원", None),
+    ("3월 10일 현장학습비 2만원 납부, 3월 5일까지", None),
+]
+
+def scenario_templates(bench: Bench) -> Dict[str, object]:
+    """공지사항 양식: 입력 예시에서 양식 적중률·정확도와 모델 호출 대신 아낀 시간."""
+    histogram = bench.reset()
+    fill_ms, model_ms = [], []
+    hits, correct, wrong, by_intent = 0, 0, [], {}
+    for keywords, expected in _NOTICE_CORPUS:
+        start = time.perf_counter()
+        found = templates.match(keywords)
+        fill_ms.append((time.perf_counter() - start) * 1000)
+        if found:
+            hits += 1
+            by_intent[found.intent] = by_intent.get(found.intent, 0) + 1
+        if (found.intent if found else None) == expected:
+            correct += found is not None
+        else:
+            wrong.append({"input": keywords, "expected": expected, "got": found.intent if found else None})
+    # 같은 입력을 모델로 만들 때의 지연 (가짜 백엔드, 캐시 없이)
+    for keywords, _ in _NOTICE_CORPUS[:bench.n(20, 8)]:
+        model_ms.append(timed(lambda: services.generate_public_notice(keywords, True, use_cache=False)))
+    recurring = sum(1 for _, expected in _NOTICE_CORPUS if expected)
+    fill, model = percentiles(fill_ms), percentiles(model_ms)
+    # 앱처럼 양식을 먼저 시도하고 놓치면 모델로: 모델 요청 1건으로만 세어야 함
+    before = {row["종류"]: row for row in histogram.summary()}.get("public", {}).get("요청", 0)
+    if services.fill_public_template("다음 주부터 낮잠 이불 가져와 주세요", True) is None:
+        services.generate_public_notice("다음 주부터 낮잠 이불 가져와 주세요", True, use_cache=False)
+    counted = {row["종류"]: row for row in histogram.summary()}["public"]["요청"] - before
+    return {
+        "inputs": len(_NOTICE_CORPUS),
+        "recurring_inputs": recurring,
+        "hit_rate": round(hits / len(_NOTICE_CORPUS), 3),
+        "recurring_hit_rate": round(correct / recurring, 3),
+        "precision": round(correct / hits, 3) if hits else None,
+        "hits_by_intent": by_intent,
+        "mismatches": wrong,
+        "fill_ms": fill,
+        "model_ms": model,
+        # 적중 1건마다 모델 호출 p50만큼 기다리지 않음
+        "latency_saved_s": round(hits * (model["p50"] - fill["p50"]) / 1000, 2),
+        "api_calls_saved": hits,
+        "requests_counted_for_miss": counted,
+        # 모델로 넘겨야 할 공지(취소·연기 등)를 양식으로 채우면 뜻이 바뀌므로 실패
+        "failures": [
+            f"{m['input']!r} filled as {m['got']}" for m in wrong if m["expected"] is None
+        ] + ([f"template miss counted as {counted} requests"] if counted != 1 else []),
+    }
+
+def _quota_worker(path: str, increments: int) -> None:
+    store = QuotaStore(path, limit=10 ** 9)
+    for _ in range(increments):
+        store.try_consume("bench")
+
+def scenario_quota(bench: Bench) -> Dict[str, object]:
+    """사용량 저장소에 스레드·프로세스로 동시에 증가 요청 → 유실 여부 확인."""
+    path = os.path.join(bench.tmpdir, "usage.db")
+    store = QuotaStore(path, limit=10 ** 9)
+    threads_n, procs_n, per_worker = 8, 4, bench.n(200, 50)
+    ctx = multiprocessing.get_context("spawn")
+    workers = [threading.Thread(target=_quota_worker, args=(path, per_worker)) for _ in range(threads_n)]
+    workers += [ctx.Process(target=_quota_worker, args=(path, per_worker)) for _ in range(procs_n)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    expected = (threads_n + procs_n) * per_worker
+    counted = store.count()
+    lost = expected - counted
+    return {
+        "expected": expected,
+        "counted": counted,
+        "lost": lost,
+        "increments_per_s": round(counted / elapsed, 1),
+        "failures": [f"{lost} increments lost"] if lost else [],
+    }
+
+SCENARIOS = {
+    "single": scenario_single,
+    "multi_photo": scenario_multi_photo,
+    "burst": scenario_burst,
+    "batch": scenario_batch,
+    "preprocess": scenario_preprocess,
+    "rerun": scenario_rerun,
+    "prompt": scenario_prompt,
+    "uploads": scenario_uploads,
+    "jobs": scenario_jobs,
+    "history": scenario_history,
+    "dedup": scenario_dedup,
+    "startup": scenario_startup,
+    "routing": scenario_routing,
+    "templates": scenario_templates,
+    "quota": scenario_quota,
+}
+
+def run_scenario(bench: Bench, name: str) -> Dict[str, object]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = SCENARIOS[name](bench)
+    result["duration_s"] = round(time.perf_counter() - start, 3)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result["peak_traced_mb"] = round(peak / 2 ** 20, 1)
+    # ru_maxrss는 리눅스에서 KB 단위, 프로세스 전체 최대값
+    result["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+def compare(current: Dict[str, object], baseline: Dict[str, object]) -> List[str]:
+    """처리량과 p95 지연을 이전 결과와 비교한 줄들을 만듭니다."""
+    lines = []
+    for name, result in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        for path in (("throughput_rps",), ("latency_ms", "p95"), ("ttft_ms", "p95"), ("duration_s",)):
+            new_value, old_value = result, old
+            for key in path:
+                new_value = new_value.get(key) if isinstance(new_value, dict) else None
+                old_value = old_value.get(key) if isinstance(old_value, dict) else None
+            if new_value is not None and old_value:
+                lines.append(f"{name}.{'.'.join(path)}: {old_value} -> {new_value} ({new_value / old_value:.2f}x)")
+    return lines
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="오프라인 성능 벤치마크")
+    parser.add_argument("scenarios", nargs="*", help=f"실행할 시나리오 (기본: 전체) - {', '.join(SCENARIOS)}")
+    parser.add_argument("--quick", action="store_true", help="요청 수와 가짜 지연을 줄여 빠르게 실행")
+    parser.add_argument("-o", "--output", help="결과 JSON 저장 경로")
+    parser.add_argument("--baseline", help="비교할 이전 결과 JSON")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"알 수 없는 시나리오: {', '.join(unknown)}")
+
+    bench = Bench(args.quick, DEFAULT_PROFILE)
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "quick": args.quick,
+        "profile": bench.profile,
+        "scenarios": {},
+    }
+    failures = []
+    for name in args.scenarios or list(SCENARIOS):
+        print(f"[benchmark] {name} ...", file=sys.stderr)
+        report["scenarios"][name] = run_scenario(bench, name)
+        failures += [f"{name}: {failure}" for failure in report["scenarios"][name].get("failures", [])]
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            for line in compare(report, json.load(f)):
+                print(line, file=sys.stderr)
+    # 시나리오가 failures에 적은 검사 실패가 있으면 0이 아닌 값으로 끝냄 (CI에서 확인용)
+    for failure in failures:
+        print(f"[benchmark] 실패 - {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+def make_key(*parts: str, digests: Iterable[str] = ()) -> str:
+    """프롬프트·모델명·이미지 다이제스트로 캐시 키(sha256)를 만듭니다."""
+    h = hashlib.sha256()
+    for part in list(parts) + list(digests):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+class ResponseCache:
+    """메모리 LRU + 선택적 디스크 계층으로 구성된 응답 캐시입니다.
+
+    세션 간에 공유되므로 모든 접근은 잠금으로 보호합니다.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: float = 24 * 3600,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: int = 50 * 1024 * 1024
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+    def get(self, key: str) -> Optional[str]:
+        """캐시된 응답을 반환합니다. 없거나 만료되었으면 None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, text = entry
+                if now - created <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return text
+                del self._memory[key]
+
+            entry = self._read_disk(key, now)
+            if entry is not None:
+                self._put_memory(key, *entry)
+                self._stats["hits"] += 1
+                self._stats["disk_hits"] += 1
+                return entry[1]
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, text: str) -> None:
+        """응답을 캐시에 저장합니다."""
+        created = time.time()
+        with self._lock:
+            self._put_memory(key, created, text)
+            self._write_disk(key, created, text)
+
+    def stats(self) -> Dict[str, float]:
+        """적중/미스 통계를 반환합니다."""
+        with self._lock:
+            total = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._memory),
+                "hit_rate": self._stats["hits"] / total if total else 0.0,
+            }
+
+    def _put_memory(self, key: str, created: float, text: str) -> None:
+        self._memory[key] = (created, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # --- 디스크 계층 ---
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str, now: float) -> Optional[tuple]:
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now - entry["created"] > self.ttl_seconds:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry["created"], entry["text"]
+
+    def _write_disk(self, key: str, created: float, text: str) -> None:
+        if not self.disk_dir:
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp_path = self._path(key) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"created": created, "text": text}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+            self._evict_disk()
+        except OSError as e:
+            logger.warning("디스크 캐시 저장 실패: %s", e)
+
+    def _evict_disk(self) -> None:
+        """용량 한도를 넘으면 오래된 파일부터 지웁니다."""
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".json"):
+                path = os.path.join(self.disk_dir, name)
+                st = os.stat(path)
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(path)
+            total -= size
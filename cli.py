@@ -0,0 +1,155 @@
+"""Streamlit 없이 알림장/공지사항을 일괄 생성하는 명령줄 진입점.
+
+사용법:
+    python -m cli jobs.jsonl -o results.jsonl --concurrency 4
+    cat jobs.jsonl | python -m cli > results.jsonl
+    python -m cli --saved-style jobs.jsonl            # 기본 말투 프로필 사용
+    python -m cli --style-profile 김선생 jobs.jsonl   # 이름으로 말투 프로필 사용
+
+작업(JSONL 한 줄):
+    {"id": "a1", "type": "daily", "keywords": "모래놀이", "images": ["a.jpg"], "use_emoji": true, "style": "..."}
+    {"id": "n1", "type": "public", "keywords": "금요일 생일파티, 10시 시작"}
+"""
+import time
+
+_START = time.perf_counter()
+
+import argparse
+import json
+import logging
+import sys
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, TextIO
+
+from dotenv import load_dotenv
+
+import images
+import services
+import styles
+from config import BATCH_CONCURRENCY, DEFAULT_STYLE_PROFILE
+
+logger = logging.getLogger("cli")
+
+def _read_jobs(stream: TextIO) -> Iterator[Dict[str, object]]:
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            job = {"_error": f"{line_no}번째 줄 JSON 파싱 실패: {e}"}
+        if not isinstance(job, dict):
+            job = {"_error": f"{line_no}번째 줄은 JSON 객체가 아닙니다."}
+        job.setdefault("id", line_no)
+        yield job
+
+def run_job(job: Dict[str, object], default_style: str = "", owner: str = "") -> Dict[str, object]:
+    """작업 하나를 실행하고 결과 레코드를 반환합니다. 예외는 레코드의 error로 담습니다."""
+    start = time.perf_counter()
+    record = {"id": job["id"], "type": job.get("type")}
+    try:
+        if "_error" in job:
+            raise ValueError(job["_error"])
+        use_emoji = bool(job.get("use_emoji", True))
+        if job.get("type") == "daily":
+            photos, failed = images.preprocess_images(job.get("images") or [], max_workers=1)
+            if failed:
+                raise ValueError(f"사진을 읽지 못했습니다: {failed[0][1]}")
+            text, from_cache = services.generate_daily_notice(
+                images=photos,
+                keywords=job.get("keywords", ""),
+                style_content=job.get("style", default_style),
+                use_emoji=use_emoji,
+                owner=owner
+            )
+        elif job.get("type") == "public":
+            text, from_cache = services.generate_public_notice(
+                notice_keywords=job.get("keywords", ""),
+                use_emoji=use_emoji,
+                owner=owner
+            )
+        else:
+            raise ValueError(f"알 수 없는 작업 종류: {job.get('type')!r} (daily 또는 public)")
+        record.update(ok=True, text=text, from_cache=from_cache)
+    except Exception as e:
+        record.update(ok=False, error=str(e))
+    record["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return record
+
+def run(
+    jobs: Iterator[Dict[str, object]],
+    out: TextIO,
+    concurrency: int,
+    default_style: str = "",
+    owner: str = ""
+) -> int:
+    """최대 concurrency개의 작업만 동시에 띄우고, 끝나는 대로 결과를 한 줄씩 씁니다.
+
+    실패한 작업 수를 반환합니다. 생성 기록은 owner(말투 프로필 이름) 앞으로 남깁니다.
+    """
+    failures = 0
+    pending = set()
+
+    def drain(return_when):
+        nonlocal failures, pending
+        done, pending = wait(pending, return_when=return_when)
+        for future in done:
+            record = future.result()
+            failures += not record["ok"]
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for job in jobs:
+            if len(pending) >= concurrency:
+                drain(FIRST_COMPLETED)
+            pending.add(pool.submit(run_job, job, default_style, owner))
+        if pending:
+            drain(ALL_COMPLETED)
+    return failures
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m cli", description="알림장/공지사항 일괄 생성")
+    parser.add_argument("jobs", nargs="?", help="작업 JSONL 파일 (생략하면 표준 입력)")
+    parser.add_argument("-o", "--output", help="결과 JSONL 파일 (생략하면 표준 출력)")
+    parser.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY, help="동시 요청 수")
+    style = parser.add_mutually_exclusive_group()
+    style.add_argument(
+        "--style-profile", dest="style_profile", metavar="PROFILE",
+        help="이 이름으로 저장된 말투 프로필의 요약본을 기본값으로 사용"
+    )
+    style.add_argument(
+        "--saved-style", dest="style_profile", action="store_const", const=DEFAULT_STYLE_PROFILE,
+        help=f"기본 말투 프로필({DEFAULT_STYLE_PROFILE})의 요약본을 기본값으로 사용"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    load_dotenv()
+    if not services.configure_genai():
+        logger.error("GOOGLE_API_KEY 환경 변수가 설정되지 않았습니다.")
+        return 2
+    logger.info("시작 준비 완료: %.0f ms", (time.perf_counter() - _START) * 1000)
+
+    default_style = ""
+    if args.style_profile:
+        profile = styles.get_style_store().get(args.style_profile)
+        if profile is None:
+            logger.error("말투 프로필을 찾을 수 없습니다: %s", args.style_profile)
+            return 2
+        default_style = profile["excerpt"]
+    src = open(args.jobs, encoding="utf-8") if args.jobs else sys.stdin
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        failures = run(_read_jobs(src), out, max(1, args.concurrency), default_style, args.style_profile or "")
+    finally:
+        if args.jobs:
+            src.close()
+        if args.output:
+            out.close()
+    logger.info("전체 소요 시간: %.0f ms, 실패 %d건", (time.perf_counter() - _START) * 1000, failures)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
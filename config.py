@@ -2,16 +2,103 @@ import os
 
 # --- 설정 상수 ---
 DAILY_LIMIT = 100
-STYLE_FILE_PATH = os.path.join("data", "style_reference.txt")
+QUOTA_DB_PATH = os.path.join("data", "usage.db")   # 사용량 기록 (여러 프로세스가 공유)
+QUOTA_PER_USER_LIMIT = None    # 사용자(IP)별 한도 (None이면 사용 안 함)
+QUOTA_WINDOW_SECONDS = None    # None이면 자정 기준 하루, 숫자면 최근 N초 슬라이딩 윈도우
+STYLE_FILE_PATH = os.path.join("data", "style_reference.txt")   # 예전 단일 말투 파일 (기본 프로필로 옮겨짐)
+STYLE_DB_PATH = os.path.join("data", "styles.db")   # 선생님별 말투 프로필
+DEFAULT_STYLE_PROFILE = "default"
+STYLE_TOKEN_BUDGET = 300       # 프롬프트에 넣을 말투 요약본의 최대 토큰 수
+STYLE_CACHE_MAX_ENTRIES = 256  # 메모리에 둘 말투 프로필 수 (읽을 때마다 updated_at으로 최신인지 확인)
+CHARS_PER_TOKEN = 2            # 한국어 기준 대략적인 글자/토큰 비율
 PAGE_TITLE = "우리선생님 문서도우미"
 PAGE_ICON = "☀️"
 MODEL_NAME = 'gemini-2.5-flash'
+MODEL_REGISTRY_SIZE = 64       # 재사용할 모델 객체 최대 개수
+
+# --- 모델 라우팅 ---
+# 위에서부터 조건(notice_type, min_images, max_images, max_tokens)이 맞는 첫 규칙을 씁니다.
+# models는 시도 순서이며, 앞 모델이 과부하(429/5xx)·시간 초과(timeout초, 스트리밍은 첫 조각까지)면 다음 모델로 넘어갑니다.
+# latency_budget_ms를 주면 최근 지연 중앙값이 이를 넘는 모델은 다음 모델 뒤로 미룹니다.
+MODEL_ROUTES = [
+    # 사진 없는 짧은 공지사항은 가벼운 모델로 빠르게
+    {"name": "public", "notice_type": "public", "max_images": 0, "max_tokens": 1500,
+     "models": ["gemini-2.5-flash-lite", MODEL_NAME]},
+    # 사진이 많은 알림장은 응답이 길어지므로 시간 제한을 넉넉하게
+    {"name": "daily_photos", "notice_type": "daily", "min_images": 4, "timeout": 60, "latency_budget_ms": 30000,
+     "models": [MODEL_NAME, "gemini-2.5-flash-lite"]},
+    {"name": "default", "latency_budget_ms": 15000, "models": [MODEL_NAME, "gemini-2.5-flash-lite"]},
+]
+ROUTE_ATTEMPT_TIMEOUT_SECONDS = 30   # 대체 모델이 남아 있을 때 한 모델의 응답(스트리밍은 첫 조각)을 기다리는 최대 시간
+ROUTE_STATS_WINDOW = 50              # 모델별로 보관할 최근 호출 수
+ROUTE_STATS_WINDOW_SECONDS = 300     # 이보다 오래된 호출은 통계에서 뺌
+ROUTE_MIN_SAMPLES = 5                # 오류율·지연으로 판단하기 위한 최소 호출 수
+ROUTE_MAX_ERROR_RATE = 0.5           # 최근 오류율이 이 이상이면 그 모델을 뒤로 미룸
+
+# --- 이미지 전처리 ---
+IMAGE_MAX_EDGE = 1536          # 긴 변 최대 픽셀
+IMAGE_FORMAT = "JPEG"          # "JPEG" 또는 "WEBP"
+IMAGE_QUALITY = 85             # 초기 인코딩 품질
+IMAGE_MIN_QUALITY = 50         # 용량 초과 시 내려갈 수 있는 최저 품질
+IMAGE_MAX_BYTES = 400 * 1024   # 사진 1장당 최대 전송 용량
+IMAGE_WORKERS = 4              # 사진 동시 전처리 스레드 수
+IMAGE_PREVIEW_EDGE = 320       # 화면 미리보기 썸네일 긴 변 픽셀
+IMAGE_DEDUP_THRESHOLD = 12     # 비슷한 사진으로 볼 dHash 해밍 거리 (64비트 중, 묶음 안의 모든 사진 쌍에 적용)
+
+# --- 업로드 관리 ---
+UPLOAD_SPILL_DIR = None        # 원본 사진 임시 보관 위치 (None이면 시스템 임시 폴더 아래)
+UPLOAD_SPILL_TTL_SECONDS = 6 * 3600   # 세션이 정리하지 못한 임시 파일을 지울 때까지의 시간
+
+# --- 응답 캐시 ---
+CACHE_MAX_ENTRIES = 256                        # 메모리 LRU 최대 항목 수
+CACHE_TTL_SECONDS = 24 * 3600                  # 캐시 유효 시간
+CACHE_DIR = os.path.join("data", "cache")      # 디스크 캐시 위치 (None이면 메모리만 사용)
+CACHE_MAX_DISK_BYTES = 50 * 1024 * 1024        # 디스크 캐시 최대 용량
+
+# --- 요청 디스패치 (Gemini 호출 속도 제한) ---
+DISPATCH_RPM = 1000                  # 모델 분당 요청 한도 (요금제에 맞게 조정)
+DISPATCH_TPM = 1_000_000             # 모델 분당 토큰 한도
+DISPATCH_MAX_CONCURRENCY = 8         # 동시에 보낼 수 있는 요청 수
+DISPATCH_MAX_QUEUE = 50              # 대기열 최대 길이 (넘으면 바로 거절)
+DISPATCH_MAX_RETRIES = 4             # 429/5xx 재시도 횟수
+DISPATCH_BACKOFF_BASE_SECONDS = 1.0  # 재시도 백오프 기본값
+DISPATCH_BACKOFF_MAX_SECONDS = 20.0  # 재시도 백오프 최대값
+DISPATCH_DEADLINE_SECONDS = 90       # 대기+재시도를 포함한 요청 마감 시간
+IMAGE_TOKENS = 258                   # 사진 1장당 예상 입력 토큰 수
+
+# --- 생성 기록 ---
+# 생성 결과 기록 (None이면 끔). 기록은 로그인 없이 선생님 이름(말투 프로필)으로만 나뉘므로,
+# 이름을 아는 사람은 누구나 볼 수 있음. 공개 배포에서는 끄고, 혼자 쓰는 배포에서만
+# os.path.join("data", "history.db") 등으로 켬
+HISTORY_DB_PATH = None
+HISTORY_PAGE_SIZE = 10         # 사이드바 기록 목록 한 페이지 크기
+
+# --- 백그라운드 생성 작업 ---
+JOB_WORKERS = 8                # 생성 작업을 실행할 공유 스레드 수
+JOB_TTL_SECONDS = 600          # 끝난 작업 결과를 보관하는 시간
+JOB_POLL_SECONDS = 0.5         # 진행 중인 작업 화면 갱신 주기
+
+# --- 공지사항 양식 ---
+TEMPLATES_ENABLED = True       # 자주 쓰는 공지(생일파티·소풍·휴원·원비·상담)는 양식으로 먼저 만듦
+TEMPLATE_MAX_UNUSED_WORDS = 0  # 양식에 담기지 않는 뜻 있는 단어가 이보다 많으면 모델로 생성 (0이면 하나라도 있으면 모델로)
+
+# --- 계측 ---
+METRICS_LOG_PATH = None        # 요청별 JSONL 기록 경로 (예: data/metrics.jsonl). 크기 제한 없이 쌓이므로 기본은 끔
+METRICS_HTTP_PORT = None       # Prometheus 형식 /metrics 포트 (None이면 끔)
+METRICS_MAX_SAMPLES = 1000     # 종류·항목별로 보관할 최근 샘플 수
+
+# --- 반 전체 일괄 생성 ---
+BATCH_CONCURRENCY = 4            # 동시에 보낼 Gemini 요청 수
+BATCH_MAX_RETRIES = 2            # 아이별 재시도 횟수 (대기열이 가득 찼을 때만, 429/5xx는 디스패처가 재시도)
+BATCH_RETRY_BASE_SECONDS = 2.0   # 재시도 백오프 기본 대기 시간
+BATCH_MAX_PHOTO_BYTES = 200 * 1024 * 1024   # 사진 zip/폴더의 압축 해제 후 최대 전체 용량
 
 # --- 프롬프트 템플릿 ---
+# 요청마다 같은 부분(역할, 지침, 이모티콘, 말투)은 시스템 지침(SYSTEM_*)으로 보내고,
+# 요청마다 바뀌는 키워드만 사용자 메시지(USER_*)로 보냅니다.
 # 1. 알림장 (개인)
-PROMPT_DAILY_NOTICE = """
+SYSTEM_DAILY_NOTICE = """
 당신은 다정한 어린이집 선생님입니다. 사진과 키워드를 보고 학부모님께 보낼 알림장을 작성해주세요.
-키워드: {keywords}
 {style_instruction}
 
 [지침]
@@ -20,11 +107,11 @@ PROMPT_DAILY_NOTICE = """
 3. {emoji_instruction}
 4. 한국어로 작성
 """
+USER_DAILY_NOTICE = "키워드: {keywords}"
 
 # 2. 공지사항 (전체)
-PROMPT_PUBLIC_NOTICE = """
+SYSTEM_PUBLIC_NOTICE = """
 당신은 베테랑 어린이집 선생님입니다. 학부모님 전체에게 보낼 공지사항을 작성해주세요.
-내용: {notice_keywords}
 
 [지침]
 1. 정중하면서도 따뜻한 어조
@@ -33,6 +120,7 @@ PROMPT_PUBLIC_NOTICE = """
 4. {emoji_instruction}
 5. 한국어로 작성
 """
+USER_PUBLIC_NOTICE = "내용: {notice_keywords}"
 
 # 이모티콘 지침
 EMOJI_INSTRUCTION_ON = "문장 사이사이에 내용과 어울리는 이모티콘(😊, 🌳, 🎈 등)을 풍부하게 사용해줘."
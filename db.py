@@ -0,0 +1,32 @@
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+class LocalConnection:
+    """스레드·프로세스마다 따로 여는 SQLite 연결 (quota·styles·history 저장소 공용).
+
+    호출하면 현재 스레드의 연결을 돌려줍니다. fork 이후 부모의 연결을 공유하지 않도록
+    pid가 바뀌면 새로 엽니다. 처음 만들 때 DB 파일을 WAL 모드로 바꿔 둡니다
+    (WAL 모드는 DB 파일에 기록되므로 한 번만 설정하면 됨).
+    """
+
+    def __init__(self, path: str, row_factory: Optional[type] = None, synchronous: Optional[str] = None):
+        self.path = path
+        self.row_factory = row_factory
+        self.synchronous = synchronous
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self().execute("PRAGMA journal_mode=WAL")
+
+    def __call__(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            if self.synchronous:
+                conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
@@ -0,0 +1,256 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, TypeVar
+from config import (
+    DISPATCH_RPM, DISPATCH_TPM, DISPATCH_MAX_CONCURRENCY, DISPATCH_MAX_QUEUE,
+    DISPATCH_MAX_RETRIES, DISPATCH_BACKOFF_BASE_SECONDS, DISPATCH_BACKOFF_MAX_SECONDS,
+    DISPATCH_DEADLINE_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class DispatchError(Exception):
+    """디스패처가 요청을 보내지 못했을 때의 기본 예외."""
+
+class QueueFullError(DispatchError):
+    def __init__(self):
+        super().__init__("지금 요청이 너무 많아요. 잠시 후 다시 시도해주세요.")
+
+class DeadlineExceededError(DispatchError):
+    def __init__(self):
+        super().__init__("대기 시간이 너무 길어 요청을 취소했어요. 잠시 후 다시 시도해주세요.")
+
+class RetryableError(Exception):
+    """재시도해도 되는 일시적 오류 (가짜 모델 등에서 사용)."""
+
+# google.api_core 예외를 직접 import하지 않고 이름/상태 코드로 판별
+_RETRYABLE_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "InternalServerError", "DeadlineExceeded", "GatewayTimeout",
+}
+_RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+def is_retryable(error: Exception) -> bool:
+    """429/5xx처럼 잠시 후 다시 보내면 성공할 수 있는 오류인지 판별합니다."""
+    if isinstance(error, RetryableError):
+        return True
+    if type(error).__name__ in _RETRYABLE_NAMES:
+        return True
+    return getattr(error, "code", None) in _RETRYABLE_CODES
+
+class TokenBucket:
+    """분당 한도를 초당 비율로 채우는 토큰 버킷 (잠금은 호출하는 쪽에서)."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """amount만큼 꺼내려면 기다려야 하는 시간(초)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+class Dispatcher:
+    """Gemini 호출 앞단의 프로세스 공용 디스패처.
+
+    - 동시 실행 수 제한 + 순서가 보이는 대기열 (가득 차면 QueueFullError)
+    - RPM/TPM 토큰 버킷으로 제공자 한도에 맞춰 전송 속도 조절
+    - 재시도 가능한 오류는 지수 백오프 + 지터로 다시 보냄
+    - 마감 시간(deadline)을 넘기면 대기/재시도를 멈추고 DeadlineExceededError
+    """
+
+    def __init__(
+        self,
+        rpm: float = DISPATCH_RPM,
+        tpm: float = DISPATCH_TPM,
+        max_concurrency: int = DISPATCH_MAX_CONCURRENCY,
+        max_queue: int = DISPATCH_MAX_QUEUE,
+        max_retries: int = DISPATCH_MAX_RETRIES,
+        backoff_base: float = DISPATCH_BACKOFF_BASE_SECONDS,
+        backoff_max: float = DISPATCH_BACKOFF_MAX_SECONDS,
+        deadline_seconds: float = DISPATCH_DEADLINE_SECONDS
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline_seconds = deadline_seconds
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._cond = threading.Condition()
+        self._waiting: deque = deque()
+        self._in_flight = 0
+        self._stats = {"completed": 0, "failed": 0, "retries": 0, "rejected": 0, "timed_out": 0}
+
+    def call(
+        self,
+        fn: Callable[[], T],
+        tokens: int = 1,
+        timeout: Optional[float] = None,
+        on_wait: Optional[Callable[[int], None]] = None,
+        max_retries: Optional[int] = None,
+        hold: bool = False,
+        deadline: Optional[float] = None
+    ) -> T:
+        """fn을 한도 안에서 실행합니다.
+
+        tokens는 요청의 예상 토큰 수, on_wait는 대기 순번(1부터)이 바뀔 때마다 호출됩니다.
+        max_retries를 주면 이 호출에서만 재시도 횟수를 바꿉니다 (대체 모델로 넘길 때는 0).
+        hold=True이면 성공한 뒤에도 실행 슬롯을 잡아 둡니다. fn이 첫 조각만 받아 오는 스트림이
+        끝날 때까지 동시 요청 수에 포함되도록, 다 읽거나 닫은 뒤 release()를 불러야 합니다.
+        deadline(time.monotonic() 기준 시각)을 주면 timeout 대신 그 시각을 마감으로 씁니다.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + (timeout or self.deadline_seconds)
+        retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            self._enter(deadline, on_wait)
+            held = False
+            try:
+                self._throttle(tokens, deadline)
+                result = fn()
+                self._count("completed")
+                held = hold
+                return result
+            except DispatchError:
+                raise
+            except Exception as e:
+                # 마감까지 남은 시간을 시간 제한으로 준 호출이 끝나지 않은 경우
+                if is_retryable(e) and time.monotonic() >= deadline:
+                    self._count("timed_out")
+                    raise DeadlineExceededError() from e
+                if not is_retryable(e) or attempt >= retries:
+                    self._count("failed")
+                    raise
+                error = e
+            finally:
+                if not held:
+                    self._leave()
+
+            attempt += 1
+            delay = self.backoff(attempt)
+            if time.monotonic() + delay > deadline:
+                self._count("timed_out")
+                raise DeadlineExceededError() from error
+            logger.warning("일시적 오류로 %.1f초 후 재시도 (%d/%d): %s", delay, attempt, retries, error)
+            self._count("retries")
+            time.sleep(delay)
+
+    def release(self) -> None:
+        """call(hold=True)나 retain()으로 잡아 둔 실행 슬롯을 반환합니다."""
+        self._leave()
+
+    def retain(self) -> None:
+        """call()의 fn 안에서 불러 지금 쓰는 실행 슬롯을 하나 더 잡습니다.
+
+        fn이 끝나도 fn이 띄운 요청(시간 초과로 기다리지 않기로 한 호출 등)이 동시 요청 수에 남도록,
+        그 요청이 끝나면 release()를 불러야 합니다. 이미 잡은 슬롯을 넘겨받는 것이라 대기하지 않습니다.
+        """
+        with self._cond:
+            self._in_flight += 1
+
+    def backoff(self, attempt: int) -> float:
+        """attempt번째 재시도 전 대기 시간. full jitter: 0 ~ min(최대값, 기본값 * 2^n) 사이 무작위."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def stats(self) -> Dict[str, int]:
+        """처리/재시도/거절 통계와 현재 대기열 상태를 반환합니다."""
+        with self._cond:
+            return {**self._stats, "waiting": len(self._waiting), "in_flight": self._in_flight}
+
+    def _count(self, key: str) -> None:
+        with self._cond:
+            self._stats[key] += 1
+
+    def _enter(self, deadline: float, on_wait: Optional[Callable[[int], None]]) -> None:
+        """대기열 맨 앞이 되고 실행 슬롯이 날 때까지 기다립니다."""
+        ticket = object()
+        with self._cond:
+            if len(self._waiting) >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise QueueFullError()
+            self._waiting.append(ticket)
+
+        last_position = None
+        try:
+            while True:
+                with self._cond:
+                    position = self._waiting.index(ticket)
+                    if position == 0 and self._in_flight < self.max_concurrency:
+                        self._waiting.popleft()
+                        self._in_flight += 1
+                        self._cond.notify_all()
+                        return
+                # 콜백(화면 갱신 등)은 잠금 밖에서 호출
+                if on_wait and position != last_position:
+                    on_wait(position + 1)
+                    last_position = position
+                with self._cond:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timed_out"] += 1
+                        raise DeadlineExceededError()
+                    self._cond.wait(timeout=min(remaining, 0.5))
+        except BaseException:
+            with self._cond:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                self._cond.notify_all()
+            raise
+
+    def _leave(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _throttle(self, tokens: int, deadline: float) -> None:
+        """RPM/TPM 버킷에 여유가 생길 때까지 기다린 뒤 소비합니다."""
+        while True:
+            with self._cond:
+                wait = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+                if wait <= 0:
+                    self._requests.consume(1)
+                    self._tokens.consume(tokens)
+                    return
+            if time.monotonic() + wait > deadline:
+                with self._cond:
+                    self._stats["timed_out"] += 1
+                raise DeadlineExceededError()
+            time.sleep(wait)
+
+_dispatcher_lock = threading.Lock()
+_dispatcher: Optional[Dispatcher] = None
+
+def get_dispatcher() -> Dispatcher:
+    """프로세스에서 공유하는 디스패처를 반환합니다."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = Dispatcher()
+        return _dispatcher
+
+def set_dispatcher(dispatcher: Optional[Dispatcher]) -> None:
+    """공용 디스패처를 교체합니다 (벤치마크 등). None이면 다음 호출 때 기본값으로 다시 만듭니다."""
+    global _dispatcher
+    with _dispatcher_lock:
+        _dispatcher = dispatcher
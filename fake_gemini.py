@@ -0,0 +1,148 @@
+"""네트워크·API 할당량 없이 성능을 재기 위한 가짜 Gemini 백엔드.
+
+`services.set_model_factory(make_factory(...))`로 끼우면 services.py의 실제 코드
+(캐시, 디스패처, 계측, 스트리밍)를 그대로 지나면서 모델 호출만 흉내 냅니다.
+같은 seed면 지연 시간과 오류 발생 순서가 재현됩니다.
+"""
+import random
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+from dispatch import RetryableError
+from services import estimate_tokens
+
+class ResourceExhausted(RetryableError):
+    """429 (분당 한도 초과)를 흉내 내는 오류. 이름은 google.api_core 예외와 같습니다."""
+
+class DeadlineExceeded(RetryableError):
+    """request_options의 timeout 안에 응답하지 못했을 때의 오류 (504)."""
+
+class _Usage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+class _Chunk:
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeResponse:
+    def __init__(self, text: str, usage: _Usage):
+        self.text = text
+        self.usage_metadata = usage
+
+class FakeStreamResponse:
+    """SDK처럼 첫 조각은 호출 시점에 받고, 나머지는 반복하면서 받습니다.
+
+    SDK처럼 request_options의 timeout은 스트림 전체의 마감이라, 넘기면 반복 중에 DeadlineExceeded가 납니다.
+    """
+
+    def __init__(self, chunks: List[str], interval: float, usage: _Usage, deadline: Optional[float] = None):
+        self._chunks = chunks
+        self._interval = interval
+        self._deadline = deadline
+        self.usage_metadata = None
+        self._usage = usage
+
+    def __iter__(self) -> Iterator[_Chunk]:
+        for idx, text in enumerate(self._chunks):
+            if idx:
+                time.sleep(self._interval)
+                if self._deadline is not None and time.monotonic() > self._deadline:
+                    raise DeadlineExceeded("504 Deadline Exceeded while streaming (fake)")
+            yield _Chunk(text)
+        self.usage_metadata = self._usage
+
+class FakeProfile:
+    """가짜 모델의 지연/오류 특성."""
+
+    def __init__(
+        self,
+        latency: float = 1.2,
+        jitter: float = 0.2,
+        ttft: float = 0.4,
+        chunk_interval: float = 0.05,
+        chunks: int = 10,
+        error_rate: float = 0.0,
+        output_chars: int = 400,
+        seed: int = 0
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.ttft = ttft
+        self.chunk_interval = chunk_interval
+        self.chunks = chunks
+        self.error_rate = error_rate
+        self.output_chars = output_chars
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """(지연 배율, 오류 여부)를 재현 가능한 순서로 뽑습니다."""
+        with self._lock:
+            return 1 + self._rng.uniform(-self.jitter, self.jitter), self._rng.random() < self.error_rate
+
+class FakeModel:
+    """genai.GenerativeModel과 같은 모양의 가짜 모델."""
+
+    def __init__(
+        self,
+        model_name: str,
+        generation_config: Optional[dict] = None,
+        system_instruction: Optional[str] = None,
+        profile: Optional[FakeProfile] = None
+    ):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.profile = profile or FakeProfile()
+        self.calls = 0
+
+    def _text(self) -> str:
+        sentence = "오늘 우리 친구들은 즐겁게 놀이했어요. "
+        return (sentence * (self.profile.output_chars // len(sentence) + 1))[:self.profile.output_chars]
+
+    def _wait(self, seconds: float, timeout: Optional[float]) -> None:
+        if timeout is not None and seconds > timeout:
+            time.sleep(timeout)
+            raise DeadlineExceeded(f"504 Deadline Exceeded after {timeout:.1f}s (fake)")
+        time.sleep(seconds)
+
+    def generate_content(self, contents, stream: bool = False, request_options: Optional[dict] = None):
+        self.calls += 1
+        timeout = (request_options or {}).get("timeout")
+        scale, fail = self.profile.draw()
+        input_tokens = estimate_tokens(contents)
+        if self.system_instruction:
+            input_tokens += estimate_tokens(self.system_instruction)
+        text = self._text()
+        usage = _Usage(input_tokens, len(text) // 2)
+
+        if not stream:
+            self._wait(self.profile.latency * scale, timeout)
+            if fail:
+                raise ResourceExhausted("429 Resource has been exhausted (fake)")
+            return FakeResponse(text, usage)
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        self._wait(self.profile.ttft * scale, timeout)
+        if fail:
+            raise ResourceExhausted("429 Resource has been exhausted (fake)")
+        size = max(1, len(text) // self.profile.chunks)
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        return FakeStreamResponse(chunks, self.profile.chunk_interval * scale, usage, deadline)
+
+def make_factory(models: Optional[Dict[str, dict]] = None, **profile_kwargs):
+    """services.set_model_factory에 넘길 팩토리를 만듭니다.
+
+    모든 모델이 하나의 프로필(난수열)을 공유하고, models에 적은 모델명만 기본값 위에
+    덮어쓴 자기 프로필을 씁니다 (예: {"gemini-2.5-flash-lite": {"latency": 0.3}}).
+    """
+    profile = FakeProfile(**profile_kwargs)
+    overrides = {
+        name: FakeProfile(**{**profile_kwargs, "seed": profile_kwargs.get("seed", 0) + idx + 1, **kwargs})
+        for idx, (name, kwargs) in enumerate((models or {}).items())
+    }
+
+    def factory(model_name, generation_config=None, system_instruction=None):
+        return FakeModel(model_name, generation_config, system_instruction, profile=overrides.get(model_name, profile))
+    return factory
@@ -0,0 +1,216 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from db import LocalConnection
+from config import HISTORY_DB_PATH, HISTORY_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# trigram 토크나이저는 띄어쓰기·조사와 상관없이 3글자 이상 부분 문자열을 색인함 (SQLite 3.34+)
+_TOKENIZERS = ("trigram", "unicode61")
+
+def style_hash(style_content: str) -> str:
+    """말투 예시의 짧은 해시 (같은 말투로 만든 기록끼리 묶을 때 사용)."""
+    if not style_content:
+        return ""
+    return hashlib.sha256(style_content.encode("utf-8")).hexdigest()[:16]
+
+class HistoryStore:
+    """생성한 알림장·공지사항을 쌓아 두는 기록 저장소 (SQLite, 추가 전용).
+
+    본문과 키워드는 FTS5로 색인해 검색하고, 목록은 id 기준 키셋 페이지네이션으로
+    필요한 페이지만 읽습니다. 지난 기록을 다시 쓰는 데에는 API 호출이 필요 없습니다.
+    기록마다 주인(owner, 말투 프로필 이름)을 남겨 선생님별로 나눠 봅니다.
+    """
+
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        self.path = path
+        self._conn = LocalConnection(path, row_factory=sqlite3.Row)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS notices ("
+            " id INTEGER PRIMARY KEY,"
+            " notice_type TEXT NOT NULL,"
+            " keywords TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " use_emoji INTEGER NOT NULL,"
+            " style_hash TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " owner TEXT NOT NULL DEFAULT '')"
+        )
+        # owner 칸이 생기기 전에 만든 DB는 칸을 추가 (기존 기록은 주인 없음 '')
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(notices)")}
+        if "owner" not in columns:
+            conn.execute("ALTER TABLE notices ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_notices_type ON notices (notice_type, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_notices_owner ON notices (owner, id)")
+        self.tokenizer = self._init_fts(conn)
+
+    def _init_fts(self, conn: sqlite3.Connection) -> Optional[str]:
+        """FTS5 색인을 만듭니다. 이미 있으면 그 토크나이저를, FTS5가 없으면 None을 반환합니다."""
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'notices_fts'").fetchone()
+        if row is not None:
+            return "trigram" if "trigram" in row["sql"] else "unicode61"
+        for tokenizer in _TOKENIZERS:
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE notices_fts USING fts5("
+                    " keywords, text, content='notices', content_rowid='id',"
+                    f" tokenize='{tokenizer}')"
+                )
+            except sqlite3.OperationalError as e:
+                logger.info("FTS5 %s 토크나이저를 쓸 수 없습니다: %s", tokenizer, e)
+                continue
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS notices_ai AFTER INSERT ON notices BEGIN"
+                " INSERT INTO notices_fts (rowid, keywords, text) VALUES (new.id, new.keywords, new.text);"
+                " END"
+            )
+            # 이전에 색인 없이 쌓인 기록이 있으면 한 번 색인
+            conn.execute("INSERT INTO notices_fts (notices_fts) VALUES ('rebuild')")
+            return tokenizer
+        logger.warning("FTS5를 쓸 수 없어 기록 검색은 LIKE로 동작합니다.")
+        return None
+
+    def record(
+        self,
+        notice_type: str,
+        keywords: str,
+        text: str,
+        use_emoji: bool,
+        style_content: str = "",
+        created_at: Optional[float] = None,
+        owner: str = ""
+    ) -> int:
+        """생성 결과 1건을 기록하고 id를 반환합니다."""
+        cursor = self._conn().execute(
+            "INSERT INTO notices (notice_type, keywords, text, use_emoji, style_hash, created_at, owner)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                notice_type, keywords, text, int(use_emoji), style_hash(style_content),
+                created_at or time.time(), owner
+            )
+        )
+        return cursor.lastrowid
+
+    def record_many(self, entries: Iterable[Dict[str, object]]) -> int:
+        """여러 건을 한 트랜잭션으로 기록합니다 (가져오기·벤치마크용)."""
+        rows = [
+            (
+                e["notice_type"], e["keywords"], e["text"], int(bool(e.get("use_emoji"))),
+                style_hash(e.get("style_content", "")), e.get("created_at") or time.time(), e.get("owner", "")
+            )
+            for e in entries
+        ]
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT INTO notices (notice_type, keywords, text, use_emoji, style_hash, created_at, owner)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def get(self, notice_id: int) -> Optional[Dict[str, object]]:
+        row = self._conn().execute("SELECT * FROM notices WHERE id = ?", (notice_id,)).fetchone()
+        return dict(row) if row else None
+
+    def page(
+        self,
+        query: str = "",
+        notice_type: Optional[str] = None,
+        before_id: Optional[int] = None,
+        limit: int = HISTORY_PAGE_SIZE,
+        owner: Optional[str] = None
+    ) -> List[Dict[str, object]]:
+        """최신순으로 한 페이지를 읽습니다. 다음 페이지는 마지막 행의 id를 before_id로 넘깁니다.
+
+        query는 공백으로 나눈 모든 단어를 포함하는 기록만 찾습니다.
+        owner를 주면 그 주인의 기록만 읽습니다 (None이면 전체, 관리·벤치마크용).
+        """
+        terms = query.split()
+        match, likes = self._split_terms(terms)
+        clauses, params = [], []
+        if match:
+            clauses.append("n.id IN (SELECT rowid FROM notices_fts WHERE notices_fts MATCH ?)")
+            params.append(match)
+        for term in likes:
+            clauses.append("(n.text LIKE ? ESCAPE '\\' OR n.keywords LIKE ? ESCAPE '\\')")
+            pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            params += [pattern, pattern]
+        if notice_type:
+            clauses.append("n.notice_type = ?")
+            params.append(notice_type)
+        if owner is not None:
+            clauses.append("n.owner = ?")
+            params.append(owner)
+        if before_id is not None:
+            clauses.append("n.id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn().execute(
+            f"SELECT n.* FROM notices n {where} ORDER BY n.id DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, owner: Optional[str] = None) -> int:
+        if owner is None:
+            return self._conn().execute("SELECT COUNT(*) FROM notices").fetchone()[0]
+        return self._conn().execute("SELECT COUNT(*) FROM notices WHERE owner = ?", (owner,)).fetchone()[0]
+
+    def _split_terms(self, terms: List[str]):
+        """검색어를 FTS MATCH 식과 LIKE로 찾을 단어로 나눕니다.
+
+        trigram은 3글자 미만 단어를 색인으로 찾지 못하므로 그런 단어는 LIKE로 거릅니다.
+        """
+        if self.tokenizer is None:
+            return None, terms
+        quoted = lambda term: '"' + term.replace('"', '""') + '"'
+        if self.tokenizer == "trigram":
+            long_terms = [t for t in terms if len(t) >= 3]
+            short_terms = [t for t in terms if len(t) < 3]
+            return (" AND ".join(quoted(t) for t in long_terms) or None), short_terms
+        # unicode61은 단어 단위 색인이라 조사가 붙은 단어도 찾도록 접두어 검색
+        return (" AND ".join(quoted(t) + "*" for t in terms) or None), []
+
+_store_lock = threading.Lock()
+_store: Optional[HistoryStore] = None
+
+def get_history_store() -> HistoryStore:
+    """프로세스에서 공유하는 기록 저장소를 반환합니다."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
+
+def set_history_store(store: Optional[HistoryStore]) -> None:
+    """공용 저장소를 교체합니다 (벤치마크 등). None이면 다음 호출 때 config 기준으로 다시 만듭니다."""
+    global _store
+    with _store_lock:
+        _store = store
+
+def record(
+    notice_type: str,
+    keywords: str,
+    text: str,
+    use_emoji: bool,
+    style_content: str = "",
+    owner: str = ""
+) -> None:
+    """공용 저장소에 기록합니다. 기록 실패가 생성 흐름을 막지 않도록 오류는 로그만 남깁니다."""
+    if not HISTORY_DB_PATH:
+        return
+    try:
+        get_history_store().record(notice_type, keywords, text, use_emoji, style_content, owner=owner)
+    except Exception as e:
+        logger.warning("생성 기록 저장 실패: %s", e)
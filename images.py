@@ -0,0 +1,219 @@
+import functools
+import io
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, BinaryIO, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+import metrics
+from config import (
+    IMAGE_MAX_EDGE, IMAGE_FORMAT, IMAGE_QUALITY, IMAGE_MIN_QUALITY, IMAGE_MAX_BYTES, IMAGE_WORKERS,
+    IMAGE_PREVIEW_EDGE, IMAGE_DEDUP_THRESHOLD
+)
+
+# Pillow는 사진을 처음 다룰 때 불러옴 (공지사항 화면처럼 사진이 없는 화면의 첫 로딩을 늦추지 않도록)
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+@functools.lru_cache(maxsize=1)
+def _laplacian():
+    """선명도 측정용 라플라시안 커널 (음수가 잘리지 않도록 128을 더함)."""
+    from PIL import ImageFilter
+    return ImageFilter.Kernel((3, 3), [0, 1, 0, 1, -4, 1, 0, 1, 0], scale=1, offset=128)
+
+def _source_size(source: Union[str, BinaryIO]) -> int:
+    """원본 파일 크기(바이트)를 구합니다."""
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    size = getattr(source, "size", None)
+    if size is not None:
+        return size
+    pos = source.tell()
+    source.seek(0, io.SEEK_END)
+    size = source.tell()
+    source.seek(pos)
+    return size
+
+def _downscale(img: "Image.Image", max_edge: int) -> "Image.Image":
+    """긴 변이 max_edge 이하가 되도록 축소합니다."""
+    long_edge = max(img.size)
+    if long_edge <= max_edge:
+        return img
+    # 정수 배율 축소(reduce)로 먼저 크게 줄이고, 남은 비율만 리샘플링
+    factor = long_edge // max_edge
+    if factor >= 2:
+        img = img.reduce(factor)
+    scale = max_edge / max(img.size)
+    if scale < 1:
+        from PIL import Image
+        new_size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        img = img.resize(new_size, Image.LANCZOS)
+    return img
+
+def _encode(img: "Image.Image") -> bytes:
+    """메타데이터 없이 재인코딩하고, 용량 한도를 넘으면 품질을 낮춥니다."""
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    quality = IMAGE_QUALITY
+    while True:
+        buf = io.BytesIO()
+        img.save(buf, format=IMAGE_FORMAT, quality=quality, optimize=True)
+        data = buf.getvalue()
+        if len(data) <= IMAGE_MAX_BYTES or quality <= IMAGE_MIN_QUALITY:
+            return data
+        quality = max(IMAGE_MIN_QUALITY, quality - 10)
+
+def _to_8bit(img: "Image.Image") -> "Image.Image":
+    """팔레트·흑백 1비트·16비트 PNG 등을 RGB/L로 바꿉니다 (reduce·리샘플링이 이 모드들을 지원하지 않음)."""
+    if img.mode in ("RGB", "L"):
+        return img
+    if img.mode.startswith("I;16"):
+        # 16비트 흑백은 그대로 바꾸면 255에서 잘리므로 8비트 범위로 줄임
+        return img.convert("I").point(lambda value: value / 256).convert("L")
+    return img.convert("L" if img.mode in ("1", "I", "F") else "RGB")
+
+def _load(source: Union[str, BinaryIO]) -> "Image.Image":
+    """사진을 전송용 크기로 디코딩합니다 (회전 보정·축소 포함)."""
+    from PIL import Image, ImageOps
+    img = Image.open(source)
+    # JPEG은 디코딩 단계에서 바로 1/2~1/8 크기로 읽어 디코딩 비용을 줄임.
+    # draft는 두 변이 모두 요청 크기 이상인 배율을 고르므로 원본 비율대로 요청해야 함
+    ratio = IMAGE_MAX_EDGE / max(img.size)
+    if ratio < 1:
+        img.draft("RGB", (math.ceil(img.width * ratio), math.ceil(img.height * ratio)))
+    img = _to_8bit(ImageOps.exif_transpose(img))
+    return _downscale(img, IMAGE_MAX_EDGE)
+
+def _thumbnail(img: "Image.Image", max_edge: int = IMAGE_PREVIEW_EDGE) -> "Image.Image":
+    from PIL import Image
+    thumb = img.convert("RGB") if img.mode != "RGB" else img.copy()
+    thumb.thumbnail((max_edge, max_edge), Image.BILINEAR)
+    return thumb
+
+def _encode_preview(thumb: "Image.Image") -> bytes:
+    buf = io.BytesIO()
+    thumb.save(buf, format="JPEG", quality=80)
+    return buf.getvalue()
+
+def make_preview(img: "Image.Image", max_edge: int = IMAGE_PREVIEW_EDGE) -> bytes:
+    """화면 미리보기용 작은 JPEG 썸네일을 만듭니다."""
+    return _encode_preview(_thumbnail(img, max_edge))
+
+class Fingerprint(NamedTuple):
+    """중복 사진 판별용 지문: 64비트 dHash와 선명도(라플라시안 분산)."""
+    dhash: int
+    sharpness: float
+
+def dhash(img: "Image.Image") -> int:
+    """이웃한 픽셀 밝기 차이로 만든 64비트 지각 해시. 비슷한 사진은 몇 비트만 다릅니다."""
+    from PIL import Image
+    small = img.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def sharpness(img: "Image.Image") -> float:
+    """라플라시안 분산. 흔들리거나 초점이 나간 사진일수록 작습니다."""
+    from PIL import ImageStat
+    edges = img.convert("L").filter(_laplacian())
+    return ImageStat.Stat(edges).var[0]
+
+def fingerprint(img: "Image.Image") -> Fingerprint:
+    return Fingerprint(dhash(img), sharpness(img))
+
+def group_duplicates(hashes: Sequence[int], threshold: int = IMAGE_DEDUP_THRESHOLD) -> List[List[int]]:
+    """해밍 거리가 threshold 이하인 사진끼리 묶습니다.
+
+    묶음 안의 모든 사진이 서로 threshold 이하여야 합니다 (완전 연결). 천천히 움직이며 찍은
+    연속 사진처럼 A~B, B~C만 비슷하고 A와 C는 다른 경우 셋이 한 묶음으로 이어지지 않도록,
+    업로드 순서대로 보면서 모든 사진과 가까운 첫 묶음에 넣고 없으면 새 묶음을 만듭니다.
+    반환값은 인덱스 묶음 목록이며, 업로드 순서를 유지합니다.
+    """
+    groups: List[List[int]] = []
+    for i, value in enumerate(hashes):
+        for group in groups:
+            if all(bin(value ^ hashes[j]).count("1") <= threshold for j in group):
+                group.append(i)
+                break
+        else:
+            groups.append([i])
+    return groups
+
+def preprocess_image(source: Union[str, BinaryIO]) -> Dict[str, object]:
+    """사진을 Gemini 전송용으로 회전 보정·축소·재인코딩합니다.
+
+    반환값은 `generate_content`에 그대로 넘길 수 있는 {"mime_type", "data"} 형태입니다.
+    """
+    return preprocess_with_preview(source, preview=False)[0]
+
+def preprocess_with_preview(
+    source: Union[str, BinaryIO],
+    preview: bool = True
+) -> Tuple[Dict[str, object], Optional[bytes], Optional[Fingerprint]]:
+    """한 번만 디코딩해서 전송용 이미지, 미리보기 썸네일, 중복 판별용 지문을 함께 만듭니다."""
+    start = time.perf_counter()
+    raw_bytes = _source_size(source)
+
+    img = _load(source)
+    data = _encode(img)
+    thumbnail, print_ = None, None
+    if preview:
+        # 지문은 썸네일에서 계산 (해시·선명도 비교에는 이 크기로 충분)
+        thumb = _thumbnail(img)
+        thumbnail, print_ = _encode_preview(thumb), fingerprint(thumb)
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    logger.info(
+        "이미지 전처리: %d -> %d bytes, %dx%d, %.1f ms",
+        raw_bytes, len(data), img.width, img.height, elapsed_ms
+    )
+    return {"mime_type": _MIME_TYPES[IMAGE_FORMAT], "data": data}, thumbnail, print_
+
+def preprocess_images(
+    sources: Sequence[Union[str, BinaryIO]],
+    max_workers: Optional[int] = None
+) -> Tuple[List[Dict[str, object]], List[Tuple[int, Exception]]]:
+    """여러 사진을 스레드 풀에서 동시에 전처리합니다.
+
+    Pillow는 디코딩·리사이즈 중 GIL을 놓기 때문에 스레드만으로도 병렬화됩니다.
+    결과는 업로드 순서를 유지하며, 실패한 사진은 (인덱스, 예외)로 따로 돌려줍니다.
+    """
+    start = time.perf_counter()
+    workers = max(1, min(max_workers or IMAGE_WORKERS, len(sources)))
+    if workers == 1:
+        outcomes = [_try_preprocess(src) for src in sources]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(_try_preprocess, sources))
+
+    photos, errors = [], []
+    for idx, (photo, error) in enumerate(outcomes):
+        if error is not None:
+            logger.warning("사진 %d 전처리 실패: %s", idx + 1, error)
+            errors.append((idx, error))
+        else:
+            photos.append(photo)
+    metrics.record(
+        notice_type="daily",
+        stage="preprocess",
+        preprocess_ms=(time.perf_counter() - start) * 1000,
+        image_count=len(photos),
+        image_errors=len(errors),
+        preprocess_bytes=sum(len(photo["data"]) for photo in photos)
+    )
+    return photos, errors
+
+def _try_preprocess(source):
+    try:
+        return preprocess_image(source), None
+    except Exception as e:
+        return None, e
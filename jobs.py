@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import metrics
+from config import JOB_WORKERS, JOB_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+class Job:
+    """백그라운드에서 실행되는 생성 작업 1건.
+
+    작업 함수는 다른 스레드에서 돌기 때문에 Streamlit 화면 요소를 직접 건드리지 않고,
+    진행 상황(대기 순번, 스트리밍 조각, 진행률, 항목별 실패)을 이 객체에 남깁니다. 화면은 이를 주기적으로 읽습니다.
+    """
+
+    def __init__(self, job_id: str, key: str, session_id: str, kind: str):
+        self.job_id = job_id
+        self.key = key
+        self.session_id = session_id
+        self.kind = kind
+        self.status = QUEUED
+        self.result: object = None
+        self.error: Optional[Exception] = None
+        self.wait_position: Optional[int] = None
+        self.progress: Optional[Tuple[int, int]] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._chunks: List[str] = []
+        self._failures: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    @property
+    def text(self) -> str:
+        """지금까지 받은 스트리밍 텍스트."""
+        with self._lock:
+            return "".join(self._chunks)
+
+    def emit(self, chunk: str) -> None:
+        with self._lock:
+            self._chunks.append(chunk)
+
+    @property
+    def failures(self) -> List[str]:
+        """진행 중에 실패한 항목 설명 (반 전체 생성 등)."""
+        with self._lock:
+            return list(self._failures)
+
+    def add_failure(self, message: str) -> None:
+        with self._lock:
+            self._failures.append(message)
+
+    def on_wait(self, position: int) -> None:
+        """디스패처 대기열 순번 콜백."""
+        self.wait_position = position
+
+class JobManager:
+    """공유 스레드 풀에서 생성 작업을 실행하고 결과를 세션별로 보관합니다.
+
+    같은 키의 작업이 아직 끝나지 않았으면 새로 만들지 않고 그 작업을 돌려주고(중복 클릭·재실행),
+    끝난 작업은 ttl_seconds가 지나면 지웁니다.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, ttl_seconds: float = JOB_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[str, str] = {}   # 작업 키 -> 진행 중인 job_id
+        self._lock = threading.Lock()
+
+    def submit(self, session_id: str, key: str, kind: str, fn: Callable[[Job], object]) -> Tuple[Job, bool]:
+        """작업을 등록합니다. (작업, 새로 만들었는지)를 반환합니다."""
+        with self._lock:
+            self._evict(time.time())
+            job_id = self._active.get(key)
+            if job_id is not None:
+                return self._jobs[job_id], False
+            job = Job(uuid.uuid4().hex, key, session_id, kind)
+            self._jobs[job.job_id] = job
+            self._active[key] = job.job_id
+        self._pool.submit(self._run, job, fn)
+        return job, True
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        if job_id is None:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def session_jobs(self, session_id: str) -> List[Job]:
+        """세션이 등록한 작업 목록 (오래된 순)."""
+        with self._lock:
+            return sorted(
+                (job for job in self._jobs.values() if job.session_id == session_id),
+                key=lambda job: job.created_at
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def _run(self, job: Job, fn: Callable[[Job], object]) -> None:
+        job.started_at = time.time()
+        job.status = RUNNING
+        try:
+            job.result = fn(job)
+            job.status = DONE
+        except Exception as e:
+            logger.warning("작업 실패 (%s %s): %s", job.kind, job.job_id, e)
+            job.error = e
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._active.get(job.key) == job.job_id:
+                    del self._active[job.key]
+            metrics.record(
+                notice_type=job.kind,
+                stage="job",
+                job_status=job.status,
+                queue_ms=(job.started_at - job.created_at) * 1000,
+                run_ms=(job.finished_at - job.started_at) * 1000
+            )
+
+    def _evict(self, now: float) -> None:
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+_manager_lock = threading.Lock()
+_manager: Optional[JobManager] = None
+
+def get_job_manager() -> JobManager:
+    """프로세스에서 공유하는 작업 관리자를 반환합니다."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import TYPE_CHECKING, Dict, List, Optional
+from config import METRICS_LOG_PATH, METRICS_HTTP_PORT, METRICS_MAX_SAMPLES
+
+# http.server는 /metrics 서버를 켤 때만 불러옴
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# 히스토그램으로 집계할 수치 항목
+TRACKED_FIELDS = (
+    "prompt_ms", "preprocess_ms", "template_ms", "latency_ms", "ttft_ms",
+    "input_tokens", "output_tokens", "cached_tokens", "system_tokens", "image_bytes", "preprocess_bytes",
+    "style_tokens", "style_tokens_saved", "image_tokens_saved", "image_bytes_saved",
+)
+
+class JsonlSink:
+    """이벤트를 JSON Lines 파일에 한 줄씩 추가합니다."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def emit(self, event: Dict[str, object]) -> None:
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+class HistogramSink:
+    """(공지 종류, 항목)별 최근 샘플을 보관하고 백분위수를 계산합니다."""
+
+    def __init__(self, max_samples: int = METRICS_MAX_SAMPLES):
+        self._samples: Dict[tuple, deque] = defaultdict(lambda: deque(maxlen=max_samples))
+        self._outcomes: Dict[tuple, int] = defaultdict(int)
+        # 공지사항 양식 시도 결과 (hit/miss). 모델 요청(outcome)과 따로 셈
+        self._templates: Dict[tuple, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def emit(self, event: Dict[str, object]) -> None:
+        notice_type = event.get("notice_type", "unknown")
+        with self._lock:
+            if "outcome" in event:
+                self._outcomes[(notice_type, event["outcome"])] += 1
+            if "template" in event:
+                self._templates[(notice_type, event["template"])] += 1
+            for name in TRACKED_FIELDS:
+                value = event.get(name)
+                if value is not None:
+                    self._samples[(notice_type, name)].append(float(value))
+
+    def percentile(self, notice_type: str, name: str, q: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._samples.get((notice_type, name), ()))
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def summary(self) -> List[Dict[str, object]]:
+        """공지 종류별 지연 시간 p50/p95와 평균 토큰 수. 요청은 모델 요청(캐시 적중 포함)만 셉니다."""
+        with self._lock:
+            types = sorted(
+                {notice_type for notice_type, _ in self._samples}
+                | {t for t, _ in self._outcomes} | {t for t, _ in self._templates}
+            )
+            samples = {key: list(values) for key, values in self._samples.items()}
+            outcomes = dict(self._outcomes)
+            template_hits = {t: n for (t, result), n in self._templates.items() if result == "hit"}
+        rows = []
+        for notice_type in types:
+            latency = sorted(samples.get((notice_type, "latency_ms"), []))
+            input_tokens = samples.get((notice_type, "input_tokens"), [])
+            output_tokens = samples.get((notice_type, "output_tokens"), [])
+            rows.append({
+                "종류": notice_type,
+                "요청": sum(n for (t, _), n in outcomes.items() if t == notice_type),
+                "오류": outcomes.get((notice_type, "error"), 0),
+                "양식": template_hits.get(notice_type, 0),
+                "p50 ms": round(latency[int(0.5 * len(latency))]) if latency else None,
+                "p95 ms": round(latency[min(len(latency) - 1, int(0.95 * len(latency)))]) if latency else None,
+                "입력 토큰": round(sum(input_tokens) / len(input_tokens)) if input_tokens else None,
+                "출력 토큰": round(sum(output_tokens) / len(output_tokens)) if output_tokens else None,
+            })
+        return rows
+
+    def render_prometheus(self) -> str:
+        """Prometheus 텍스트 형식으로 요약(summary) 지표를 출력합니다."""
+        with self._lock:
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+            outcomes = dict(self._outcomes)
+            template_results = dict(self._templates)
+        lines = ["# TYPE notice_requests_total counter"]
+        for (notice_type, outcome), n in sorted(outcomes.items()):
+            lines.append(f'notice_requests_total{{type="{notice_type}",outcome="{outcome}"}} {n}')
+        lines.append("# TYPE notice_templates_total counter")
+        for (notice_type, result), n in sorted(template_results.items()):
+            lines.append(f'notice_templates_total{{type="{notice_type}",result="{result}"}} {n}')
+        for name in TRACKED_FIELDS:
+            lines.append(f"# TYPE notice_{name} summary")
+            for (notice_type, field), values in sorted(samples.items()):
+                if field != name or not values:
+                    continue
+                for q in (0.5, 0.95, 0.99):
+                    value = values[min(len(values) - 1, int(q * len(values)))]
+                    lines.append(f'notice_{name}{{type="{notice_type}",quantile="{q}"}} {value}')
+                lines.append(f'notice_{name}_sum{{type="{notice_type}"}} {sum(values)}')
+                lines.append(f'notice_{name}_count{{type="{notice_type}"}} {len(values)}')
+        return "\n".join(lines) + "\n"
+
+class Recorder:
+    """계측 이벤트를 등록된 모든 싱크로 보냅니다. 싱크 오류는 생성 흐름을 막지 않습니다."""
+
+    def __init__(self, sinks: List[object]):
+        self.sinks = list(sinks)
+
+    def record(self, **event) -> None:
+        event.setdefault("ts", time.time())
+        for sink in self.sinks:
+            try:
+                sink.emit(event)
+            except Exception as e:
+                logger.warning("계측 기록 실패 (%s): %s", type(sink).__name__, e)
+
+def start_http_server(histogram: HistogramSink, port: int) -> "ThreadingHTTPServer":
+    """/metrics 에서 Prometheus 형식 지표를 제공하는 백그라운드 서버를 띄웁니다."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = histogram.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("지표 엔드포인트: http://0.0.0.0:%d/metrics", port)
+    return server
+
+_recorder_lock = threading.Lock()
+_recorder: Optional[Recorder] = None
+histogram = HistogramSink()
+
+def get_recorder() -> Recorder:
+    """config 설정에 따라 만든 프로세스 공용 Recorder를 반환합니다."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            sinks = [histogram]
+            if METRICS_LOG_PATH:
+                sinks.append(JsonlSink(METRICS_LOG_PATH))
+            if METRICS_HTTP_PORT:
+                try:
+                    start_http_server(histogram, METRICS_HTTP_PORT)
+                except OSError as e:
+                    logger.warning("지표 엔드포인트를 열지 못했습니다: %s", e)
+            _recorder = Recorder(sinks)
+        return _recorder
+
+def set_recorder(recorder: Optional[Recorder]) -> None:
+    """공용 Recorder를 교체합니다 (벤치마크 등). None이면 다음 호출 때 config 기준으로 다시 만듭니다."""
+    global _recorder
+    with _recorder_lock:
+        _recorder = recorder
+
+def record(**event) -> None:
+    """프로세스 공용 Recorder로 이벤트를 기록합니다."""
+    get_recorder().record(**event)
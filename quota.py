@@ -0,0 +1,118 @@
+import datetime
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+from db import LocalConnection
+from config import DAILY_LIMIT, QUOTA_DB_PATH, QUOTA_PER_USER_LIMIT, QUOTA_WINDOW_SECONDS
+
+class QuotaExceededError(Exception):
+    def __init__(self, message: str = "오늘의 생성 한도를 초과했습니다."):
+        super().__init__(message)
+
+class QuotaStore:
+    """SQLite(WAL) 기반 사용량 저장소.
+
+    확인과 증가를 한 트랜잭션(BEGIN IMMEDIATE)에서 처리하므로 여러 세션·스레드·
+    워커 프로세스가 동시에 요청해도 증가분이 사라지거나 한도를 넘지 않습니다.
+    window_seconds가 None이면 하루(자정 기준) 단위, 숫자면 슬라이딩 윈도우로 셉니다.
+    """
+
+    def __init__(
+        self,
+        path: str = QUOTA_DB_PATH,
+        limit: int = DAILY_LIMIT,
+        per_user_limit: Optional[int] = QUOTA_PER_USER_LIMIT,
+        window_seconds: Optional[float] = QUOTA_WINDOW_SECONDS
+    ):
+        self.path = path
+        self.limit = limit
+        self.per_user_limit = per_user_limit
+        self.window_seconds = window_seconds
+        # 연결은 스레드·프로세스마다 따로 엽니다
+        self._conn = LocalConnection(path, synchronous="NORMAL")
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage_events ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id TEXT,"
+            " ts REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_ts ON usage_events (ts)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_user_ts ON usage_events (user_id, ts)")
+
+    def _window_start(self, now: float) -> float:
+        if self.window_seconds:
+            return now - self.window_seconds
+        today = datetime.date.fromtimestamp(now)
+        return datetime.datetime.combine(today, datetime.time()).timestamp()
+
+    def _count(self, conn: sqlite3.Connection, since: float, user_id: Optional[str] = None) -> int:
+        if user_id is None:
+            row = conn.execute("SELECT COUNT(*) FROM usage_events WHERE ts >= ?", (since,)).fetchone()
+        else:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM usage_events WHERE user_id = ? AND ts >= ?", (user_id, since)
+            ).fetchone()
+        return row[0]
+
+    def try_consume(self, user_id: Optional[str] = None, amount: int = 1) -> Optional[List[int]]:
+        """한도 안이면 amount만큼 사용량을 올리고 영수증(이벤트 id 목록)을 반환합니다.
+
+        한도를 넘으면 아무것도 기록하지 않고 None을 반환합니다.
+        """
+        now = time.time()
+        since = self._window_start(now)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._count(conn, since) + amount > self.limit:
+                conn.execute("ROLLBACK")
+                return None
+            if user_id is not None and self.per_user_limit is not None:
+                if self._count(conn, since, user_id) + amount > self.per_user_limit:
+                    conn.execute("ROLLBACK")
+                    return None
+            ticket = [
+                conn.execute("INSERT INTO usage_events (user_id, ts) VALUES (?, ?)", (user_id, now)).lastrowid
+                for _ in range(amount)
+            ]
+            # 집계 범위를 벗어난 오래된 기록 정리
+            conn.execute("DELETE FROM usage_events WHERE ts < ?", (min(since, now - 2 * 86400),))
+            conn.execute("COMMIT")
+            return ticket
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def refund(self, ticket: List[int]) -> None:
+        """API를 호출하지 않았거나 실패한 요청의 사용량을 되돌립니다."""
+        if not ticket:
+            return
+        conn = self._conn()
+        conn.executemany("DELETE FROM usage_events WHERE id = ?", [(event_id,) for event_id in ticket])
+
+    def count(self, user_id: Optional[str] = None) -> int:
+        """현재 집계 범위의 사용량을 반환합니다."""
+        return self._count(self._conn(), self._window_start(time.time()), user_id)
+
+    def remaining(self, user_id: Optional[str] = None) -> int:
+        """남은 사용 가능 횟수를 반환합니다 (전체 한도와 사용자 한도 중 작은 값)."""
+        left = self.limit - self.count()
+        if user_id is not None and self.per_user_limit is not None:
+            left = min(left, self.per_user_limit - self.count(user_id))
+        return max(0, left)
+
+_store_lock = threading.Lock()
+_store: Optional[QuotaStore] = None
+
+def get_quota_store() -> QuotaStore:
+    """프로세스에서 공유하는 사용량 저장소를 반환합니다."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = QuotaStore()
+        return _store
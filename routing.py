@@ -0,0 +1,286 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, TypeVar
+from dispatch import DispatchError, Dispatcher, RetryableError, get_dispatcher, is_retryable
+from config import (
+    MODEL_NAME, MODEL_ROUTES, ROUTE_ATTEMPT_TIMEOUT_SECONDS, ROUTE_STATS_WINDOW, ROUTE_STATS_WINDOW_SECONDS,
+    ROUTE_MIN_SAMPLES, ROUTE_MAX_ERROR_RATE
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class AttemptTimeout(RetryableError):
+    """대체 모델이 남아 있는데 첫 응답(스트리밍은 첫 조각)이 시간 안에 오지 않음."""
+
+def first_within(
+    start: Callable[[], T],
+    timeout: Optional[float],
+    dispatcher: Optional[Dispatcher] = None,
+    discard: Optional[Callable[[T], None]] = None
+) -> T:
+    """start()를 별도 스레드에서 실행하고 timeout초까지만 기다립니다 (None이면 그냥 실행).
+
+    스트리밍은 첫 조각을 받을 때까지만 이 시간 제한을 걸고, 나머지 스트림에는 마감이 없습니다.
+    시간을 넘기면 AttemptTimeout을 냅니다. 이미 보낸 요청은 되돌릴 수 없으므로, dispatcher를 주면
+    버린 호출이 끝날 때까지 실행 슬롯을 하나 더 잡아 두어 동시 요청 수 제한을 지키고, 늦게 도착한
+    결과는 discard로 닫습니다.
+    """
+    if timeout is None:
+        return start()
+    done = threading.Event()
+    lock = threading.Lock()
+    outcome = {}
+    abandoned = []
+
+    def run():
+        try:
+            outcome["result"] = start()
+        except BaseException as e:
+            outcome["error"] = e
+        with lock:
+            done.set()
+            if not abandoned:
+                return
+        try:
+            if "result" in outcome and discard:
+                discard(outcome["result"])
+        except Exception as e:
+            logger.warning("시간 초과로 버린 응답을 닫지 못했습니다: %s", e)
+        finally:
+            if dispatcher:
+                dispatcher.release()
+
+    threading.Thread(target=run, name="route-first-chunk", daemon=True).start()
+    done.wait(timeout)
+    with lock:
+        if not done.is_set():
+            abandoned.append(True)
+            if dispatcher:
+                dispatcher.retain()
+            raise AttemptTimeout(f"504 첫 조각을 {timeout:.1f}초 안에 받지 못했습니다.")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+class Route(NamedTuple):
+    """라우팅 규칙 1개: 조건에 맞는 요청이 시도할 모델 목록 (앞이 기본, 뒤는 장애 시 대체)."""
+    name: str
+    models: Tuple[str, ...]
+    notice_type: Optional[str] = None
+    min_images: int = 0
+    max_images: Optional[int] = None
+    max_tokens: Optional[int] = None
+    timeout: Optional[float] = ROUTE_ATTEMPT_TIMEOUT_SECONDS
+    latency_budget_ms: Optional[float] = None
+
+    @property
+    def matches_all(self) -> bool:
+        return self.notice_type is None and not self.min_images and self.max_images is None and self.max_tokens is None
+
+    def matches(self, notice_type: str, image_count: int, tokens: int) -> bool:
+        return (
+            (self.notice_type is None or self.notice_type == notice_type)
+            and image_count >= self.min_images
+            and (self.max_images is None or image_count <= self.max_images)
+            and (self.max_tokens is None or tokens <= self.max_tokens)
+        )
+
+def load_routes(rules: Sequence[Dict[str, object]] = MODEL_ROUTES) -> List[Route]:
+    """config의 규칙 목록을 Route로 바꿉니다. 어떤 규칙에도 맞지 않는 요청은 MODEL_NAME으로 보냅니다."""
+    routes = [Route(**{**rule, "models": tuple(rule["models"])}) for rule in rules]
+    if not any(route.matches_all for route in routes):
+        routes.append(Route("default", (MODEL_NAME,)))
+    return routes
+
+class ModelStats:
+    """모델별 최근 호출의 지연·오류 통계 (최근 window개, window_seconds 이내).
+
+    지연은 같은 규칙·호출 방식(lane)끼리만 비교하고, 오류율은 모델 전체로 셉니다.
+    """
+
+    def __init__(self, window: int = ROUTE_STATS_WINDOW, window_seconds: float = ROUTE_STATS_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        # (모델, lane) -> (시각, 지연 ms, 성공 여부)
+        self._samples: Dict[tuple, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, model: str, lane: str, latency_ms: float, ok: bool) -> None:
+        with self._lock:
+            self._samples[(model, lane)].append((time.monotonic(), latency_ms, ok))
+
+    def _recent(self, model: str, lane: Optional[str] = None) -> List[tuple]:
+        cutoff = time.monotonic() - self.window_seconds
+        return [
+            sample
+            for (name, sample_lane), samples in self._samples.items()
+            if name == model and (lane is None or sample_lane == lane)
+            for sample in samples if sample[0] >= cutoff
+        ]
+
+    def error_rate(self, model: str) -> Tuple[float, int]:
+        """(최근 오류율, 샘플 수)."""
+        with self._lock:
+            samples = self._recent(model)
+        if not samples:
+            return 0.0, 0
+        return sum(1 for _, _, ok in samples if not ok) / len(samples), len(samples)
+
+    def median_latency(self, model: str, lane: str) -> Tuple[Optional[float], int]:
+        """(성공한 최근 호출의 지연 중앙값 ms, 샘플 수)."""
+        with self._lock:
+            values = sorted(latency for _, latency, ok in self._recent(model, lane) if ok)
+        return (values[len(values) // 2] if values else None), len(values)
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        """모델·lane별 요약 (화면 표시용)."""
+        with self._lock:
+            keys = sorted(self._samples)
+            rows = []
+            for model, lane in keys:
+                samples = self._recent(model, lane)
+                if not samples:
+                    continue
+                ok = sorted(latency for _, latency, success in samples if success)
+                rows.append({
+                    "model": model,
+                    "lane": lane,
+                    "calls": len(samples),
+                    "error_rate": round(1 - len(ok) / len(samples), 3),
+                    "p50_ms": round(ok[len(ok) // 2], 1) if ok else None,
+                    "p95_ms": round(ok[min(len(ok) - 1, int(0.95 * len(ok)))], 1) if ok else None,
+                })
+        return rows
+
+class ModelRouter:
+    """요청마다 모델을 고르고, 과부하·시간 초과면 다음 모델로 넘깁니다.
+
+    - 규칙(MODEL_ROUTES)은 위에서부터 공지 종류·사진 수·예상 토큰으로 맞춰 봄
+    - 최근 오류율이 max_error_rate 이상인 모델은 목록 뒤로 미룸
+    - 규칙에 latency_budget_ms가 있으면, 앞 모델의 최근 지연 중앙값이 이를 넘을 때 다음 모델을 먼저 씀
+    - 대체 모델이 남아 있으면 재시도 없이, attempt 시간 제한으로 바로 넘어감 (마지막 모델만 디스패처 재시도)
+    - 마지막 모델의 호출은 디스패처 마감(DISPATCH_DEADLINE_SECONDS)까지 남은 시간을 시간 제한으로 씀
+    - 스트리밍은 fn이 첫 조각까지 받아 와야 하므로, 첫 조각 전의 오류·시간 초과만 대체됨
+      (그 뒤에 끊긴 스트림은 호출한 쪽이 stream_failed로 통계에 남김)
+    - 통계는 window_seconds가 지나면 사라지므로, 뒤로 밀렸던 모델도 그 뒤에는 다시 기본 순서로 시도됨
+    """
+
+    def __init__(
+        self,
+        routes: Optional[List[Route]] = None,
+        stats: Optional[ModelStats] = None,
+        min_samples: int = ROUTE_MIN_SAMPLES,
+        max_error_rate: float = ROUTE_MAX_ERROR_RATE
+    ):
+        self.routes = routes if routes is not None else load_routes()
+        self.stats = stats or ModelStats()
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self._failovers = 0
+        self._lock = threading.Lock()
+
+    def route(self, notice_type: str, image_count: int = 0, tokens: int = 0) -> Route:
+        for route in self.routes:
+            if route.matches(notice_type, image_count, tokens):
+                return route
+        return self.routes[-1]
+
+    def _healthy(self, model: str) -> bool:
+        rate, samples = self.stats.error_rate(model)
+        return samples < self.min_samples or rate < self.max_error_rate
+
+    def _slow(self, route: Route, model: str, lane: str) -> bool:
+        if route.latency_budget_ms is None:
+            return False
+        median, samples = self.stats.median_latency(model, lane)
+        return samples >= self.min_samples and median > route.latency_budget_ms
+
+    def order(self, route: Route, lane: str) -> List[str]:
+        """이번 요청에서 시도할 모델 순서."""
+        healthy = [model for model in route.models if self._healthy(model)]
+        unhealthy = [model for model in route.models if model not in healthy]
+        # 예산을 넘긴 모델은 예산 안의(또는 아직 모르는) 모델 뒤로
+        fast = [model for model in healthy if not self._slow(route, model, lane)]
+        slow = [model for model in healthy if model not in fast]
+        # 모두 불안정해도 마지막 수단으로는 시도
+        return fast + slow + unhealthy
+
+    def call(
+        self,
+        route: Route,
+        fn: Callable[[str, Optional[float]], T],
+        stream: bool = False,
+        tokens: int = 1,
+        on_wait: Optional[Callable[[int], None]] = None,
+        dispatcher: Optional[Dispatcher] = None
+    ) -> Tuple[str, T, int]:
+        """fn(모델명, 시간 제한 초)을 순서대로 시도합니다. (쓴 모델, 결과, 대체 횟수)를 반환합니다.
+
+        stream=True이면 fn은 시간 제한을 first_within으로 첫 조각에만 걸고, 첫 조각을 받은 뒤 반환해야 합니다.
+        이때 성공한 호출의 디스패처 슬롯은 잡아 둔 채 반환하므로, 호출한 쪽이 스트림을 다 읽거나 닫은 뒤
+        같은 dispatcher의 release()를 불러야 합니다.
+        """
+        dispatcher = dispatcher or get_dispatcher()
+        lane = f"{route.name}/{'stream' if stream else 'call'}"
+        models = self.order(route, lane)
+        for idx, model in enumerate(models):
+            last = idx == len(models) - 1
+            # 디스패처의 마감은 대기·재시도에만 걸리므로, 마지막 모델의 호출에는 마감까지 남은 시간을 시간 제한으로 줌
+            deadline = time.monotonic() + dispatcher.deadline_seconds
+
+            def attempt(model=model, last=last, deadline=deadline):
+                timeout = max(0.001, deadline - time.monotonic()) if last else route.timeout
+                sent = time.perf_counter()
+                try:
+                    result = fn(model, timeout)
+                except Exception:
+                    self.stats.record(model, lane, (time.perf_counter() - sent) * 1000, ok=False)
+                    raise
+                self.stats.record(model, lane, (time.perf_counter() - sent) * 1000, ok=True)
+                return result
+
+            try:
+                # 속도 제한·대기열은 디스패처가 담당. 대체 모델이 있으면 같은 모델로 재시도하지 않음
+                result = dispatcher.call(
+                    attempt, tokens=tokens, on_wait=on_wait, max_retries=None if last else 0, hold=stream,
+                    deadline=deadline
+                )
+            except DispatchError:
+                raise
+            except Exception as e:
+                if last or not is_retryable(e):
+                    raise
+                logger.warning("%s 모델 호출 실패, %s 모델로 전환: %s", model, models[idx + 1], e)
+                with self._lock:
+                    self._failovers += 1
+                continue
+            return model, result, idx
+        raise RuntimeError("시도할 모델이 없습니다.")
+
+    def stream_failed(self, route: Route, model: str, latency_ms: float) -> None:
+        """첫 조각 뒤에 끊긴 스트림을 그 모델의 실패로 기록합니다."""
+        self.stats.record(model, f"{route.name}/stream", latency_ms, ok=False)
+
+    def failovers(self) -> int:
+        with self._lock:
+            return self._failovers
+
+_router_lock = threading.Lock()
+_router: Optional[ModelRouter] = None
+
+def get_router() -> ModelRouter:
+    """프로세스에서 공유하는 모델 라우터를 반환합니다."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+        return _router
+
+def set_router(router: Optional[ModelRouter]) -> None:
+    """공용 라우터를 교체합니다 (벤치마크 등). None이면 다음 호출 때 config 기준으로 다시 만듭니다."""
+    global _router
+    with _router_lock:
+        _router = router
@@ -1,62 +1,459 @@
-import google.generativeai as genai
+import functools
+import hashlib
+import itertools
+import logging
 import os
-from PIL import Image
-from typing import List, Optional
-from config import MODEL_NAME, PROMPT_DAILY_NOTICE, PROMPT_PUBLIC_NOTICE, EMOJI_INSTRUCTION_ON, EMOJI_INSTRUCTION_OFF
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+from config import (
+    MODEL_NAME, SYSTEM_DAILY_NOTICE, USER_DAILY_NOTICE, SYSTEM_PUBLIC_NOTICE, USER_PUBLIC_NOTICE,
+    EMOJI_INSTRUCTION_ON, EMOJI_INSTRUCTION_OFF,
+    CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, CACHE_DIR, CACHE_MAX_DISK_BYTES, MODEL_REGISTRY_SIZE, IMAGE_TOKENS,
+    CHARS_PER_TOKEN, TEMPLATES_ENABLED
+)
+from cache import ResponseCache, make_key
+from dispatch import get_dispatcher, is_retryable
+from routing import Route, first_within, get_router
+import metrics
+import history
+import templates
+
+# google.generativeai는 첫 호출 때 불러옴 (_load_genai). 타입 표기에만 씀
+if TYPE_CHECKING:
+    import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+# 세션 간 공유되는 응답 캐시 (프로세스당 1개)
+response_cache = ResponseCache(
+    max_entries=CACHE_MAX_ENTRIES,
+    ttl_seconds=CACHE_TTL_SECONDS,
+    disk_dir=CACHE_DIR,
+    max_disk_bytes=CACHE_MAX_DISK_BYTES
+)
+
+# 설정된 모델 객체 레지스트리 (프로세스당 1개, 세션 간 공유)
+_registry_lock = threading.Lock()
+_models: "OrderedDict[tuple, genai.GenerativeModel]" = OrderedDict()
+_configured_api_key = ""
+# 모델 백엔드 (None이면 genai.GenerativeModel). 벤치마크에서 가짜 모델로 바꿔 끼웁니다.
+_model_factory = None
+# google.generativeai는 import에만 0.5초 넘게 걸려 첫 화면을 늦추므로, 실제 모델을 처음 만들 때 불러옴
+_genai_lock = threading.Lock()
+_genai = None
+_applied_api_key = ""
+
+def _load_genai():
+    """google.generativeai를 불러오고, 아직 적용하지 않은 API 키를 설정합니다."""
+    global _genai, _applied_api_key
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            _genai = genai
+        if _configured_api_key and _configured_api_key != _applied_api_key:
+            _genai.configure(api_key=_configured_api_key)
+            _applied_api_key = _configured_api_key
+        return _genai
+
+def set_model_factory(factory) -> None:
+    """모델 객체를 만드는 함수를 교체합니다. None을 넘기면 실제 Gemini로 되돌립니다."""
+    global _model_factory
+    with _registry_lock:
+        _model_factory = factory
+        _models.clear()
 
 def configure_genai() -> str:
-    """환경 변수에서 API 키를 로드하고 Gemini를 설정합니다."""
+    """환경 변수에서 API 키를 로드하고 Gemini를 설정합니다.
+
+    Streamlit은 매 상호작용마다 스크립트를 다시 실행하므로, 키가 바뀐 경우에만
+    모델 레지스트리를 비웁니다. SDK 설정은 첫 모델을 만들 때 적용됩니다.
+    """
+    global _configured_api_key
     api_key = os.getenv("GOOGLE_API_KEY", "")
-    if api_key:
-        genai.configure(api_key=api_key)
+    if api_key and api_key != _configured_api_key:
+        with _registry_lock:
+            if api_key != _configured_api_key:
+                _models.clear()
+                _configured_api_key = api_key
     return api_key
 
+def get_model(
+    model_name: str = MODEL_NAME,
+    generation_config: Optional[Dict[str, object]] = None,
+    system_instruction: Optional[str] = None
+) -> "genai.GenerativeModel":
+    """(모델명, 생성 설정, 시스템 지침)별로 캐시된 모델 객체를 반환합니다."""
+    key = (
+        model_name,
+        tuple(sorted((generation_config or {}).items())),
+        system_instruction,
+    )
+    with _registry_lock:
+        model = _models.get(key)
+        if model is not None:
+            _models.move_to_end(key)
+            return model
+        factory = _model_factory or _load_genai().GenerativeModel
+        model = factory(
+            model_name,
+            generation_config=generation_config,
+            system_instruction=system_instruction
+        )
+        _models[key] = model
+        while len(_models) > MODEL_REGISTRY_SIZE:
+            _models.popitem(last=False)
+        return model
+
+def get_instructed_model(system_instruction: str, model_name: str = MODEL_NAME):
+    """시스템 지침이 고정된 모델을 레지스트리에서 재사용해 반환합니다.
+
+    Gemini 명시적 컨텍스트 캐시는 1024토큰 이상인 지침만 받는데 지금 지침은 100~450토큰이라
+    쓰지 않습니다. 같은 지침 앞부분은 Gemini의 암묵적 캐시로만 할인됩니다.
+    """
+    return get_model(model_name, system_instruction=system_instruction)
+
 def get_emoji_instruction(use_emoji: bool) -> str:
     """이모티콘 사용 여부에 따른 지침 텍스트를 반환합니다."""
     return EMOJI_INSTRUCTION_ON if use_emoji else EMOJI_INSTRUCTION_OFF
 
-def generate_daily_notice(
-    images: List[Image.Image], 
-    keywords: str, 
-    style_content: str, 
-    use_emoji: bool
-) -> Optional[str]:
-    """알림장(개인)을 생성합니다."""
+def get_cache_stats() -> Dict[str, float]:
+    """응답 캐시 적중/미스 통계를 반환합니다."""
+    return response_cache.stats()
+
+def get_model_stats() -> List[Dict[str, object]]:
+    """모델별 최근 지연·오류율을 반환합니다."""
+    return get_router().stats.snapshot()
+
+def _route(meta: Dict[str, object]) -> Route:
+    """요청 종류·사진 수·예상 토큰으로 라우팅 규칙을 고릅니다."""
+    return get_router().route(meta["notice_type"], meta.get("image_count", 0), meta["estimated_tokens"])
+
+def _request_options(timeout: Optional[float]) -> Dict[str, object]:
+    """모델 호출 시간 제한 (대체 모델이 남아 있으면 attempt 제한, 마지막 모델은 마감까지 남은 시간)."""
+    return {"request_options": {"timeout": timeout}} if timeout else {}
+
+def _image_digest(image) -> str:
+    """이미지 내용의 sha256 다이제스트를 구합니다."""
+    if isinstance(image, dict):
+        data = image["data"]
+    else:
+        data = image.tobytes()
+    return hashlib.sha256(data).hexdigest()
+
+def estimate_tokens(contents) -> int:
+    """요청의 입력 토큰 수를 대략 추정합니다 (CHARS_PER_TOKEN자당 1토큰, 사진 1장당 IMAGE_TOKENS)."""
+    parts = contents if isinstance(contents, list) else [contents]
+    total = 0
+    for part in parts:
+        total += len(part) // CHARS_PER_TOKEN if isinstance(part, str) else IMAGE_TOKENS
+    return max(1, total)
+
+def _usage(response) -> Dict[str, Optional[int]]:
+    """응답의 usage_metadata에서 입력/출력 토큰 수를 꺼냅니다."""
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "input_tokens": getattr(usage, "prompt_token_count", None),
+        "output_tokens": getattr(usage, "candidates_token_count", None),
+        # 암묵적 컨텍스트 캐시로 할인된 입력 토큰 수
+        "cached_tokens": getattr(usage, "cached_content_token_count", None) or None,
+    }
+
+def _generate(
+    contents,
+    system_instruction: str,
+    cache_key: str,
+    use_cache: bool,
+    meta: Dict[str, object],
+    entry: Dict[str, object],
+    on_wait: Optional[Callable[[int], None]] = None
+) -> Tuple[str, bool]:
+    """캐시를 먼저 확인하고, 없으면 Gemini를 호출합니다. (텍스트, 캐시 적중 여부)를 반환합니다."""
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            metrics.record(**meta, outcome="cache_hit")
+            return cached, True
+
+    start = time.perf_counter()
+    timing = {}
+
+    def call(model_name, timeout):
+        model = get_instructed_model(system_instruction, model_name)
+        sent = time.perf_counter()
+        response = model.generate_content(contents, **_request_options(timeout))
+        text = response.text
+        timing["latency_ms"] = (time.perf_counter() - sent) * 1000
+        return response, text
+
     try:
-        model = genai.GenerativeModel(MODEL_NAME)
-        
-        style_instruction = f"말투 예시:\n{style_content}" if style_content else ""
-        emoji_instruction = get_emoji_instruction(use_emoji)
-        
-        prompt = PROMPT_DAILY_NOTICE.format(
-            keywords=keywords,
-            style_instruction=style_instruction,
-            emoji_instruction=emoji_instruction
+        # 모델 선택·대체는 라우터가, 속도 제한·대기열·재시도는 디스패처가 담당
+        model_name, (response, text), failovers = get_router().call(
+            _route(meta), call, tokens=meta["estimated_tokens"], on_wait=on_wait
         )
-        
-        # 텍스트 프롬프트와 이미지 리스트를 함께 전달
-        response = model.generate_content([prompt] + images)
-        return response.text
     except Exception as e:
-        # 실제 운영시에는 로깅을 하는 것이 좋음
-        raise e
+        metrics.record(**meta, outcome="error", error=type(e).__name__, total_ms=(time.perf_counter() - start) * 1000)
+        raise
+    total_ms = (time.perf_counter() - start) * 1000
+    logger.info("생성 완료 (%s): 전체 %.0f ms", model_name, total_ms)
+    metrics.record(
+        **meta, model=model_name, failovers=failovers, outcome="ok",
+        latency_ms=timing["latency_ms"], total_ms=total_ms, **_usage(response)
+    )
+    response_cache.set(cache_key, text)
+    history.record(text=text, **entry)
+    return text, False
 
-def generate_public_notice(
-    notice_keywords: str, 
-    use_emoji: bool
-) -> Optional[str]:
-    """공지사항(전체)을 생성합니다."""
+def _close_stream(response) -> None:
+    """읽지 않을 스트림 응답을 닫습니다 (SDK 응답은 안쪽 gRPC/HTTP 이터레이터를 취소하거나 닫음)."""
+    for target in (response, getattr(response, "_iterator", None)):
+        for name in ("cancel", "close"):
+            method = getattr(target, name, None)
+            if callable(method):
+                method()
+                return
+
+def _stream(
+    contents,
+    system_instruction: str,
+    cache_key: str,
+    use_cache: bool,
+    meta: Dict[str, object],
+    entry: Dict[str, object],
+    on_wait: Optional[Callable[[int], None]] = None
+) -> Tuple[Iterator[str], bool]:
+    """스트리밍 버전의 _generate. (텍스트 조각 이터레이터, 캐시 적중 여부)를 반환합니다."""
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            metrics.record(**meta, outcome="cache_hit")
+            return iter([cached]), True
+    return _stream_chunks(contents, system_instruction, cache_key, meta, entry, on_wait), False
+
+def _stream_chunks(
+    contents,
+    system_instruction: str,
+    cache_key: str,
+    meta: Dict[str, object],
+    entry: Dict[str, object],
+    on_wait=None
+) -> Iterator[str]:
+    start = time.perf_counter()
+    dispatcher = get_dispatcher()
+    timing = {}
+    first_token_ms = None
+    parts = []
+    outcome = "error"
+    response = None
+    routed = {}
+
+    def call(model_name, timeout):
+        model = get_instructed_model(system_instruction, model_name)
+        timing["sent"] = time.perf_counter()
+
+        def start():
+            response = model.generate_content(contents, stream=True)
+            chunks = iter(response)
+            first = next(chunks, None)
+            return response, itertools.chain([first] if first is not None else [], chunks)
+        # request_options의 timeout은 스트림 전체의 마감이라 길고 정상적인 응답도 중간에 끊김.
+        # 시간 제한은 첫 조각까지만 걸고, 나머지 스트림은 마감 없이 받음
+        return first_within(start, timeout, dispatcher, lambda result: _close_stream(result[0]))
+
+    router = get_router()
+    route = _route(meta)
+    restarts = 0
     try:
-        model = genai.GenerativeModel(MODEL_NAME)
-        
-        emoji_instruction = get_emoji_instruction(use_emoji)
-        
-        prompt = PROMPT_PUBLIC_NOTICE.format(
-            notice_keywords=notice_keywords,
-            emoji_instruction=emoji_instruction
+        while True:
+            # 첫 조각 전의 429·시간 초과는 여기서 재시도되거나 대체 모델로 넘어감.
+            # 스트림을 다 읽거나 닫을 때까지 디스패처 실행 슬롯을 잡아 두어 동시 요청 수에 포함시킴
+            routed["model"], (response, chunks), routed["failovers"] = router.call(
+                route, call, stream=True, tokens=meta["estimated_tokens"], on_wait=on_wait, dispatcher=dispatcher
+            )
+            try:
+                for chunk in chunks:
+                    text = chunk.text
+                    if not text:
+                        continue
+                    if first_token_ms is None:
+                        first_token_ms = (time.perf_counter() - timing["sent"]) * 1000
+                    parts.append(text)
+                    yield text
+                break
+            except Exception as e:
+                router.stream_failed(route, routed["model"], (time.perf_counter() - timing["sent"]) * 1000)
+                # 이미 보낸 조각이 있으면 처음부터 다시 받을 수 없으므로 그대로 실패
+                if parts or not is_retryable(e) or restarts >= dispatcher.max_retries:
+                    raise
+                error = e
+            finally:
+                dispatcher.release()
+
+            restarts += 1
+            delay = dispatcher.backoff(restarts)
+            logger.warning("스트림 도중 일시적 오류로 %.1f초 후 다시 요청 (%d/%d): %s", delay, restarts, dispatcher.max_retries, error)
+            time.sleep(delay)
+        outcome = "ok"
+    except GeneratorExit:
+        outcome = "cancelled"
+        raise
+    finally:
+        end = time.perf_counter()
+        metrics.record(
+            **meta,
+            **routed,
+            outcome=outcome,
+            ttft_ms=first_token_ms,
+            latency_ms=(end - timing["sent"]) * 1000 if "sent" in timing else None,
+            total_ms=(end - start) * 1000,
+            **(_usage(response) if outcome == "ok" else {})
         )
-        
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        raise e
+
+    total_ms = (time.perf_counter() - start) * 1000
+    logger.info(
+        "스트리밍 생성 완료 (%s): 첫 토큰 %.0f ms, 전체 %.0f ms", routed["model"], first_token_ms or total_ms, total_ms
+    )
+    # 끝까지 받은 응답만 캐시에 저장
+    response_cache.set(cache_key, "".join(parts))
+    history.record(text="".join(parts), **entry)
+
+@functools.lru_cache(maxsize=MODEL_REGISTRY_SIZE)
+def build_daily_system_instruction(style_content: str, use_emoji: bool) -> str:
+    """알림장 시스템 지침을 만듭니다. (말투, 이모티콘) 조합별로 한 번만 만들어 재사용합니다."""
+    style_instruction = f"말투 예시:\n{style_content}" if style_content else ""
+    return SYSTEM_DAILY_NOTICE.format(
+        style_instruction=style_instruction,
+        emoji_instruction=get_emoji_instruction(use_emoji)
+    )
+
+@functools.lru_cache(maxsize=2)
+def build_public_system_instruction(use_emoji: bool) -> str:
+    """공지사항 시스템 지침을 만듭니다."""
+    return SYSTEM_PUBLIC_NOTICE.format(emoji_instruction=get_emoji_instruction(use_emoji))
+
+def build_daily_prompt(keywords: str) -> str:
+    """알림장 사용자 메시지를 만듭니다."""
+    return USER_DAILY_NOTICE.format(keywords=keywords)
+
+def build_public_prompt(notice_keywords: str) -> str:
+    """공지사항 사용자 메시지를 만듭니다."""
+    return USER_PUBLIC_NOTICE.format(notice_keywords=notice_keywords)
+
+def _request_meta(
+    notice_type: str,
+    system_instruction: str,
+    contents,
+    start: float,
+    image_count: int = 0
+) -> Dict[str, object]:
+    system_tokens = estimate_tokens(system_instruction)
+    meta = {
+        "notice_type": notice_type,
+        "image_count": image_count,
+        "system_tokens": system_tokens,
+        "estimated_tokens": system_tokens + estimate_tokens(contents),
+    }
+    meta["route"] = _route(meta).name
+    meta["prompt_ms"] = (time.perf_counter() - start) * 1000
+    return meta
+
+def _daily_request(images, keywords, style_content, use_emoji, owner=""):
+    start = time.perf_counter()
+    system_instruction = build_daily_system_instruction(style_content, use_emoji)
+    prompt = build_daily_prompt(keywords)
+    # 텍스트 프롬프트와 이미지 리스트를 함께 전달
+    contents = [prompt] + images
+    meta = _request_meta("daily", system_instruction, contents, start, image_count=len(images))
+    meta["image_bytes"] = sum(len(img["data"]) for img in images if isinstance(img, dict))
+    # 대체 모델이 답해도 같은 요청이면 캐시를 함께 쓰도록 규칙 이름으로 키를 만듦
+    key = make_key(meta["route"], system_instruction, prompt, digests=[_image_digest(img) for img in images])
+    entry = {
+        "notice_type": "daily", "keywords": keywords, "use_emoji": use_emoji, "style_content": style_content,
+        "owner": owner,
+    }
+    return contents, system_instruction, key, meta, entry
+
+def _public_request(notice_keywords, use_emoji, owner=""):
+    start = time.perf_counter()
+    system_instruction = build_public_system_instruction(use_emoji)
+    prompt = build_public_prompt(notice_keywords)
+    meta = _request_meta("public", system_instruction, prompt, start)
+    key = make_key(meta["route"], system_instruction, prompt)
+    entry = {"notice_type": "public", "keywords": notice_keywords, "use_emoji": use_emoji, "owner": owner}
+    return prompt, system_instruction, key, meta, entry
+
+def generate_daily_notice(
+    images: List[Dict[str, object]],
+    keywords: str,
+    style_content: str,
+    use_emoji: bool,
+    use_cache: bool = True,
+    on_wait: Optional[Callable[[int], None]] = None,
+    owner: str = ""
+) -> Tuple[str, bool]:
+    """알림장(개인)을 생성합니다. (텍스트, 캐시 적중 여부)를 반환합니다.
+
+    use_cache=False이면 캐시를 건너뛰고 새로 생성합니다 (다시 생성).
+    on_wait는 요청이 대기열에서 기다리는 동안 대기 순번으로 호출됩니다.
+    owner는 생성 기록에 남길 주인(말투 프로필 이름)입니다.
+    """
+    contents, system_instruction, key, meta, entry = _daily_request(images, keywords, style_content, use_emoji, owner)
+    return _generate(contents, system_instruction, key, use_cache, meta, entry, on_wait)
+
+def generate_public_notice(
+    notice_keywords: str,
+    use_emoji: bool,
+    use_cache: bool = True,
+    on_wait: Optional[Callable[[int], None]] = None,
+    owner: str = ""
+) -> Tuple[str, bool]:
+    """공지사항(전체)을 생성합니다. (텍스트, 캐시 적중 여부)를 반환합니다."""
+    contents, system_instruction, key, meta, entry = _public_request(notice_keywords, use_emoji, owner)
+    return _generate(contents, system_instruction, key, use_cache, meta, entry, on_wait)
+
+def fill_public_template(
+    notice_keywords: str,
+    use_emoji: bool,
+    owner: str = ""
+) -> Optional[templates.TemplateMatch]:
+    """자주 쓰는 공지(생일파티·소풍·휴원 등)면 모델 호출 없이 양식을 채워 반환합니다. 아니면 None."""
+    if not TEMPLATES_ENABLED:
+        return None
+    start = time.perf_counter()
+    found = templates.match(notice_keywords, use_emoji)
+    metrics.record(
+        notice_type="public",
+        stage="template",
+        # 양식에서 놓친 공지는 이어서 모델로 만들어 outcome이 따로 기록되므로, 양식 결과는 별도 항목으로 셈
+        template="hit" if found else "miss",
+        intent=found.intent if found else None,
+        template_ms=(time.perf_counter() - start) * 1000
+    )
+    if found:
+        history.record("public", notice_keywords, found.text, use_emoji, owner=owner)
+    return found
+
+def stream_daily_notice(
+    images: List[Dict[str, object]],
+    keywords: str,
+    style_content: str,
+    use_emoji: bool,
+    use_cache: bool = True,
+    on_wait: Optional[Callable[[int], None]] = None,
+    owner: str = ""
+) -> Tuple[Iterator[str], bool]:
+    """알림장(개인)을 스트리밍으로 생성합니다. (텍스트 조각 이터레이터, 캐시 적중 여부)를 반환합니다."""
+    contents, system_instruction, key, meta, entry = _daily_request(images, keywords, style_content, use_emoji, owner)
+    return _stream(contents, system_instruction, key, use_cache, meta, entry, on_wait)
+
+def stream_public_notice(
+    notice_keywords: str,
+    use_emoji: bool,
+    use_cache: bool = True,
+    on_wait: Optional[Callable[[int], None]] = None,
+    owner: str = ""
+) -> Tuple[Iterator[str], bool]:
+    """공지사항(전체)을 스트리밍으로 생성합니다. (텍스트 조각 이터레이터, 캐시 적중 여부)를 반환합니다."""
+    contents, system_instruction, key, meta, entry = _public_request(notice_keywords, use_emoji, owner)
+    return _stream(contents, system_instruction, key, use_cache, meta, entry, on_wait)
@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from db import LocalConnection
+from config import (
+    STYLE_DB_PATH, STYLE_TOKEN_BUDGET, STYLE_CACHE_MAX_ENTRIES, CHARS_PER_TOKEN, STYLE_FILE_PATH, DEFAULT_STYLE_PROFILE
+)
+
+logger = logging.getLogger(__name__)
+
+# 문장 경계: 마침표·물음표·느낌표·물결표 뒤 공백, 또는 줄바꿈
+_SENTENCE_END = re.compile(r"(?<=[.!?~])\s+|\n+")
+# 중복 판별용 정규화: 공백·문장부호·이모티콘 등을 지우고 글자만 비교
+_NON_WORD = re.compile(r"[^\w]+")
+
+def estimate_text_tokens(text: str) -> int:
+    """텍스트의 토큰 수를 대략 추정합니다."""
+    return len(text) // CHARS_PER_TOKEN
+
+def _cut(sentence: str, token_budget: int) -> str:
+    """예산보다 긴 문장을 예산 안으로 자릅니다 (가능하면 단어 경계에서)."""
+    limit = max(1, token_budget) * CHARS_PER_TOKEN
+    if len(sentence) <= limit:
+        return sentence
+    cut = sentence[:limit]
+    space = cut.rfind(" ")
+    return cut[:space] if space > limit // 2 else cut
+
+def build_excerpt(content: str, token_budget: int = STYLE_TOKEN_BUDGET) -> str:
+    """말투 예시에서 중복 문장을 빼고, 예산 안에 들어오도록 대표 문장만 고릅니다.
+
+    예산을 넘으면 글 전체에 고르게 퍼진 문장을 뽑아 원래 순서대로 이어 붙입니다.
+    빈 글이 아니면 빈 요약본을 돌려주지 않습니다 (예산보다 긴 문장은 잘라서 씀).
+    """
+    sentences: List[str] = []
+    seen = set()
+    for raw in _SENTENCE_END.split(content):
+        sentence = " ".join(raw.split())
+        key = _NON_WORD.sub("", sentence)
+        if len(key) < 4 or key in seen:
+            continue
+        seen.add(key)
+        sentences.append(sentence)
+    if not sentences and content.strip():
+        # 짧은 문장만 있는 글은 통째로 씀
+        sentences = [" ".join(content.split())]
+
+    if estimate_text_tokens(" ".join(sentences)) <= token_budget:
+        return " ".join(sentences)
+
+    # 문장 하나가 예산을 넘어도 버리지 않고 잘라서 후보로 둠 (+1은 이어 붙일 때의 공백)
+    sentences = [_cut(sentence, token_budget - 1) for sentence in sentences]
+
+    # 간격을 좁혀 가며 고르게 뽑기: 0, n/2, n/4, 3n/4, ... 순서로 예산이 찰 때까지
+    picked, used = set(), 0
+    step = len(sentences)
+    while step >= 1 and used < token_budget:
+        for idx in range(0, len(sentences), step):
+            if idx in picked:
+                continue
+            cost = estimate_text_tokens(sentences[idx]) + 1
+            if used + cost > token_budget:
+                continue
+            picked.add(idx)
+            used += cost
+        step //= 2
+    if not picked:
+        # 예산이 아주 작아 공백 몫도 안 남으면 첫 문장만 예산에 맞춰 씀
+        return _cut(sentences[0], token_budget)
+    return " ".join(sentences[idx] for idx in sorted(picked))
+
+class StyleProfileStore:
+    """선생님별 말투 프로필 저장소 (SQLite, profile_id 기본 키 인덱스).
+
+    저장할 때 예산 안의 요약본(excerpt)을 미리 만들어 두고, 프롬프트에는 요약본만 넣습니다.
+    Streamlit은 재실행마다 프로필을 읽으므로 읽은 프로필(없음 포함)을 최근 cache_size개까지 메모리에
+    두고, 돌려주기 전에 그 행의 updated_at만 다시 읽어 다른 워커 프로세스의 저장·삭제도 바로 반영합니다.
+    """
+
+    def __init__(
+        self,
+        path: str = STYLE_DB_PATH,
+        token_budget: int = STYLE_TOKEN_BUDGET,
+        cache_size: int = STYLE_CACHE_MAX_ENTRIES
+    ):
+        self.path = path
+        self.token_budget = token_budget
+        self.cache_size = cache_size
+        # profile_id -> 프로필 또는 None (LRU)
+        self._cache: "OrderedDict[str, Optional[Dict[str, object]]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # 이 프로세스에서 저장·삭제할 때마다 늘어남. 읽는 도중 바뀌었으면 읽은 행을 캐시에 넣지 않음
+        self._generation = 0
+        self._conn = LocalConnection(path, row_factory=sqlite3.Row)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS style_profiles ("
+            " profile_id TEXT PRIMARY KEY,"
+            " content TEXT NOT NULL,"
+            " excerpt TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " content_tokens INTEGER NOT NULL,"
+            " excerpt_tokens INTEGER NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def get(self, profile_id: str) -> Optional[Dict[str, object]]:
+        """프로필 전체(원문, 요약본, 토큰 수)를 반환합니다. 없으면 None."""
+        conn = self._conn()
+        with self._cache_lock:
+            cached = self._cache.get(profile_id, False)
+            generation = self._generation
+        if cached is not False:
+            # 원문 대신 기본 키로 updated_at만 읽어 캐시가 최신인지 확인
+            row = conn.execute(
+                "SELECT updated_at FROM style_profiles WHERE profile_id = ?", (profile_id,)
+            ).fetchone()
+            if (row[0] if row else None) == (cached["updated_at"] if cached else None):
+                with self._cache_lock:
+                    if profile_id in self._cache:
+                        self._cache.move_to_end(profile_id)
+                return dict(cached) if cached else None
+        row = conn.execute("SELECT * FROM style_profiles WHERE profile_id = ?", (profile_id,)).fetchone()
+        profile = dict(row) if row else None
+        with self._cache_lock:
+            if self.cache_size > 0 and generation == self._generation:
+                self._cache[profile_id] = profile
+                self._cache.move_to_end(profile_id)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return dict(profile) if profile else None
+
+    def _invalidate(self, profile_id: str) -> None:
+        with self._cache_lock:
+            self._generation += 1
+            self._cache.pop(profile_id, None)
+
+    def save(self, profile_id: str, content: str) -> Dict[str, object]:
+        """말투 원문을 저장하고 요약본을 다시 계산합니다."""
+        excerpt = build_excerpt(content, self.token_budget)
+        profile = {
+            "profile_id": profile_id,
+            "content": content,
+            "excerpt": excerpt,
+            "content_hash": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+            "content_tokens": estimate_text_tokens(content),
+            "excerpt_tokens": estimate_text_tokens(excerpt),
+            "updated_at": time.time(),
+        }
+        self._conn().execute(
+            "INSERT OR REPLACE INTO style_profiles VALUES "
+            "(:profile_id, :content, :excerpt, :content_hash, :content_tokens, :excerpt_tokens, :updated_at)",
+            profile
+        )
+        self._invalidate(profile_id)
+        logger.info(
+            "말투 프로필 저장 (%s): %d -> %d 토큰",
+            profile_id, profile["content_tokens"], profile["excerpt_tokens"]
+        )
+        return profile
+
+    def delete(self, profile_id: str) -> bool:
+        cursor = self._conn().execute("DELETE FROM style_profiles WHERE profile_id = ?", (profile_id,))
+        self._invalidate(profile_id)
+        return cursor.rowcount > 0
+
+    def import_file(self, profile_id: str, path: str) -> bool:
+        """예전 단일 말투 파일을 프로필로 옮깁니다. 이미 프로필이 있으면 건너뜁니다.
+
+        다 읽은 파일은 `.migrated`를 붙여 이름을 바꾸므로 다음 실행 때 다시 옮기지 않습니다.
+        """
+        if not os.path.exists(path):
+            return False
+        imported = False
+        if self.get(profile_id) is None:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+            if content.strip():
+                self.save(profile_id, content)
+                imported = True
+        os.replace(path, path + ".migrated")
+        logger.info("예전 말투 파일 이전 완료: %s -> %s.migrated", path, path)
+        return imported
+
+_store_lock = threading.Lock()
+_store: Optional[StyleProfileStore] = None
+
+def get_style_store() -> StyleProfileStore:
+    """프로세스에서 공유하는 말투 프로필 저장소를 반환합니다.
+
+    처음 만들 때 예전 단일 말투 파일이 있으면 기본 프로필로 옮깁니다.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StyleProfileStore()
+            try:
+                _store.import_file(DEFAULT_STYLE_PROFILE, STYLE_FILE_PATH)
+            except Exception as e:
+                logger.warning("예전 말투 파일을 옮기지 못했습니다: %s", e)
+        return _store
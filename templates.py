@@ -0,0 +1,296 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from config import TEMPLATE_MAX_UNUSED_WORDS
+
+# 자주 쓰는 공지사항 양식. 키워드가 의도(intent)에 맞고 필수 칸이 채워지면 모델 호출 없이 바로 만듭니다.
+# 줄 안의 {칸}이 하나라도 비면 그 줄은 뺍니다. {칸}{을/를}은 받침에 맞는 조사를 붙입니다.
+
+class Template(NamedTuple):
+    """공지 양식 1개: 의도, 이 의도로 볼 단어(-> 제목에 쓸 이름), 필수 칸, 본문 줄."""
+    intent: str
+    label: str
+    triggers: Dict[str, str]
+    required: Tuple[str, ...]
+    lines: Tuple[str, ...]
+
+TEMPLATES = (
+    Template(
+        "birthday", "생일파티",
+        {"생일파티": "생일파티", "생일 파티": "생일파티", "생일잔치": "생일잔치", "생일": "생일파티"},
+        ("date",),
+        (
+            "[공지] 🎂 {date} {topic} 안내",
+            "안녕하세요, 학부모님! 😊",
+            "{date}에 우리 반 친구들의 {topic}{을/를} 열어요.",
+            "🎉 생일 주인공: {honorees}",
+            "⏰ 시간: {time}",
+            "🎒 준비물: {items}",
+            "친구들과 함께 축하하며 즐거운 추억을 만들 수 있도록 많은 관심 부탁드립니다. 감사합니다! 🎈",
+        ),
+    ),
+    Template(
+        "field_trip", "소풍·현장학습",
+        {"현장체험학습": "현장체험학습", "체험학습": "체험학습", "현장학습": "현장학습", "소풍": "소풍",
+         "견학": "견학", "나들이": "나들이"},
+        ("date",),
+        (
+            "[공지] 🚌 {date} {topic} 안내",
+            "안녕하세요, 학부모님! 😊",
+            "{date}에 {topic}{을/를} 다녀올 예정이에요.",
+            "📍 장소: {place}",
+            "⏰ 시간: {time}",
+            "🎒 준비물: {items}",
+            "아이들이 편안한 옷차림과 운동화로 등원할 수 있도록 도와주세요.",
+            "안전하고 즐거운 {topic}{이/가} 되도록 선생님들이 꼼꼼히 살피겠습니다. 감사합니다! 🌳",
+        ),
+    ),
+    Template(
+        "closure", "휴원",
+        {"개원기념일": "개원기념일 휴원", "여름방학": "여름방학", "겨울방학": "겨울방학", "방학": "방학",
+         "휴원": "휴원", "휴무": "휴원", "연휴": "연휴 휴원", "쉽니다": "휴원", "쉬어요": "휴원"},
+        ("date",),
+        (
+            "[공지] 📅 {date} {topic} 안내",
+            "안녕하세요, 학부모님! 😊",
+            "{date}{은/는} {topic}{으로/로} 어린이집이 쉬어갑니다.",
+            "{reopen}부터 정상 운영합니다.",
+            "궁금하신 점은 담임 선생님께 편하게 문의해 주세요.",
+            "가족과 함께 행복한 시간 보내세요. 감사합니다! 🏡",
+        ),
+    ),
+    Template(
+        "fee", "원비 납부",
+        {"특별활동비": "특별활동비", "현장학습비": "현장학습비", "교재비": "교재비", "활동비": "활동비",
+         "원비": "원비", "회비": "회비", "납부": "원비", "수납": "원비"},
+        ("date",),
+        (
+            "[공지] 💳 {topic} 납부 안내",
+            "안녕하세요, 학부모님! 😊",
+            "{topic} 납부를 안내드립니다.",
+            "💰 금액: {amount}",
+            "📅 납부 기한: {date}까지",
+            "📌 납부 방법: {method}",
+            "기한 내 납부 부탁드리며, 궁금하신 점은 담임 선생님께 문의해 주세요. 감사합니다!",
+        ),
+    ),
+    Template(
+        "meeting", "상담·행사",
+        {"학부모 상담": "학부모 상담", "부모 상담": "학부모 상담", "상담": "학부모 상담", "간담회": "학부모 간담회",
+         "오리엔테이션": "오리엔테이션", "설명회": "설명회", "참여수업": "부모 참여수업", "참관수업": "참관수업"},
+        ("date",),
+        (
+            "[공지] 🗓️ {date} {topic} 안내",
+            "안녕하세요, 학부모님! 😊",
+            "{date}에 {topic}{을/를} 진행합니다.",
+            "⏰ 시간: {time}",
+            "📍 장소: {place}",
+            "바쁘시더라도 참석해 주시면 감사하겠습니다. 참석이 어려우시면 미리 말씀해 주세요. 😊",
+        ),
+    ),
+)
+
+# 모든 의도의 단어를 긴 것부터
+_TRIGGERS = sorted(
+    ((trigger, template) for template in TEMPLATES for trigger in template.triggers),
+    key=lambda item: len(item[0]), reverse=True
+)
+# "학부모 상담"처럼 띄어 쓴 단어와 제목 이름의 각 부분 (양식 제목에 이미 담기므로 남은 단어로 세지 않음)
+_TRIGGER_WORDS = {
+    part for template in TEMPLATES for phrase in (*template.triggers, *template.triggers.values())
+    for part in phrase.split()
+}
+
+class TemplateMatch(NamedTuple):
+    intent: str
+    label: str
+    text: str
+    slots: Dict[str, str]
+
+# --- 칸 추출 ---
+_DAY = r"[월화수목금토일]요일"
+_DATE_TOKEN = (
+    r"(?:\d{1,2}\s*월\s*\d{1,2}\s*일|\d{1,2}\s*/\s*\d{1,2}|\d{1,2}\s*일"
+    rf"|(?:이번|다음|다다음)\s*주\s*{_DAY}|{_DAY}|내일|모레)"
+    r"(?:\s*\(\s*[월화수목금토일]\s*\))?"
+)
+_DATE = re.compile(rf"{_DATE_TOKEN}(?:\s*(?:~|-|부터)\s*{_DATE_TOKEN}(?:\s*까지)?)?")
+_TIME_TOKEN = r"(?:(?:오전|오후|아침|저녁)\s*)?(?:\d{1,2}\s*시(?:\s*\d{1,2}\s*분|\s*반)?|\d{1,2}:\d{2})"
+_TIME = re.compile(rf"{_TIME_TOKEN}(?:\s*(?:~|-|부터)\s*{_TIME_TOKEN}(?:\s*까지)?)?")
+_AMOUNT = re.compile(r"\d[\d,]*\s*(?:만\s*)?원|\d+\s*만\s*원")
+_METHOD = re.compile(r"계좌\s*이체|자동\s*이체|카드\s*결제|현금")
+_PLACE_BEFORE = re.compile(r"(\S+?)(?:으로|로)\s*(?=(?:소풍|견학|현장학습|체험학습|나들이))|(\S+)\s+(?=견학)")
+_PLACE_AT = re.compile(r"(\S+?)에서")
+# 라벨 뒤의 내용을 그대로 칸에 넣음
+_LABELS = {
+    "준비물": "items", "장소": "place", "생일자": "honorees", "생일 주인공": "honorees", "주인공": "honorees",
+    "금액": "amount", "비용": "amount", "납부 방법": "method", "시간": "time", "날짜": "date", "일시": "date",
+}
+_LIST_SLOTS = ("items", "honorees")
+_LABEL_NAMES = "|".join(sorted(map(re.escape, _LABELS), key=len, reverse=True))
+_LABEL = re.compile(rf"^({_LABEL_NAMES})\s*[:：]?\s*")
+# 문장 중간의 "장소: ..."처럼 쌍점이 붙은 라벨에서도 나눔
+_CLAUSE = re.compile(rf"\n|[;/]|,(?!\d{{3}})|(?<!\d)\.(?!\d)|\s+(?=(?:{_LABEL_NAMES})\s*[:：])")
+_REOPEN = re.compile(r"정상\s*(?:운영|등원)|등원\s*재개|다시\s*등원")
+_EMOJI = re.compile("[\U0001F000-\U0001FAFF\u2600-\u27BF\u23E9-\u23FA\u2B50\uFE0F]")
+_JOSA = re.compile(r"\{(\w+)\}\{(\w+)/(\w+)\}")
+_SLOT = re.compile(r"\{(\w+)\}")
+# "내일에"처럼 '에'를 붙이지 않는 날짜
+_BARE_DATES = ("오늘", "내일", "모레")
+# 양식이 이미 담고 있거나 뜻이 없는 단어 (남은 단어 수 셀 때 뺌)
+_FILLER = {
+    "안내", "공지", "공지사항", "예정", "진행", "있음", "있습니다", "합니다", "해요", "입니다", "시작", "출발", "도착",
+    "우리", "우리반", "반", "어린이집", "친구들", "아이들", "모두", "전체", "날", "당일", "관련", "부탁", "부탁드립니다",
+    "드립니다", "참고", "꼭", "및", "그리고", "일정", "행사", "예요", "이에요", "운영", "등원", "정상", "재개", "다시",
+    "까지", "부터", "이번", "다음", "주", "오전", "오후", "에", "는", "은", "기한",
+}
+# 취소·연기·부정처럼 양식의 뜻을 뒤집는 말. 몇 개까지 봐주는 남은 단어와 달리 하나만 있어도 모델로 넘김
+_REVERSAL = re.compile(r"취소|연기|아님|아니|금지|변경|없|대신|대체")
+_NEGATIONS = {"안", "못"}
+_NUMBERISH = re.compile(r"\d+\s*(?:월|주|번|회|명)?")
+_PARTICLES = ("으로", "에서", "까지", "부터", "은", "는", "이", "가", "을", "를", "에", "의", "도", "로", "와", "과")
+
+def _has_batchim(word: str) -> bool:
+    last = word.strip()[-1:] if word.strip() else ""
+    return "가" <= last <= "힣" and (ord(last) - ord("가")) % 28 != 0
+
+def _josa(word: str, with_batchim: str, without: str) -> str:
+    # 'ㄹ' 받침 뒤의 '으로'는 '로'
+    if with_batchim == "으로" and word and "가" <= word[-1] <= "힣" and (ord(word[-1]) - ord("가")) % 28 == 8:
+        return without
+    return with_batchim if _has_batchim(word) else without
+
+def _intent(text: str) -> Tuple[Optional[Template], str]:
+    """(의도 양식, 가장 먼저 걸린 단어)를 반환합니다. 애매하면 (None, "")."""
+    # 가장 많이 걸린 의도를 고름. 긴 단어부터 맞춰 '현장학습비'가 '현장학습'으로 잡히지 않게 함
+    hits: Dict[str, List[str]] = {}
+    spans: List[Tuple[int, int]] = []
+    for trigger, template in _TRIGGERS:
+        for found in re.finditer(re.escape(trigger), text):
+            if any(start < found.end() and found.start() < end for start, end in spans):
+                continue
+            spans.append(found.span())
+            hits.setdefault(template.intent, []).append(trigger)
+    if not hits:
+        return None, ""
+    ranked = sorted(hits.items(), key=lambda item: len(item[1]), reverse=True)
+    # 두 의도가 같은 수로 걸리면 애매하므로 모델에 맡김
+    if len(ranked) > 1 and len(ranked[0][1]) == len(ranked[1][1]):
+        return None, ""
+    template = next(t for t in TEMPLATES if t.intent == ranked[0][0])
+    return template, ranked[0][1][0]
+
+def _remove(text: str, spans: List[Tuple[int, int]]) -> str:
+    for start, end in sorted(spans, reverse=True):
+        text = text[:start] + " " + text[end:]
+    return text
+
+def extract_slots(text: str) -> Tuple[Dict[str, str], List[str], List[str]]:
+    """키워드에서 날짜·시간·준비물 등 칸을 뽑습니다.
+
+    (칸, 어디에도 쓰이지 않은 단어, 이미 채운 칸과 다른 값)을 반환합니다. "5월 1일, 5월 8일 휴원"처럼
+    한 칸에 값이 둘이면 하나를 버리지 않고 세 번째 목록에 담습니다.
+    """
+    slots: Dict[str, str] = {}
+    leftover: List[str] = []
+    conflicts: List[str] = []
+    lists: Dict[str, List[str]] = {}
+    in_list = None
+
+    def put(name: str, value: str) -> None:
+        if name not in slots:
+            slots[name] = value
+        elif slots[name] != value:
+            conflicts.append(value)
+    for clause in (c.strip() for c in _CLAUSE.split(text)):
+        if not clause:
+            continue
+        label = _LABEL.match(clause)
+        if label:
+            name, value = _LABELS[label.group(1)], clause[label.end():].strip()
+            in_list = name if name in _LIST_SLOTS else None
+            if in_list:
+                lists.setdefault(name, []).extend([value] if value else [])
+            elif value:
+                put(name, value)
+            continue
+        spans = []
+        for name, pattern in (("date", _DATE), ("time", _TIME), ("amount", _AMOUNT), ("method", _METHOD)):
+            for found in pattern.finditer(clause):
+                spans.append(found.span())
+                value = re.sub(r"\s+", " ", found.group(0)).strip()
+                if name == "date" and _REOPEN.search(clause) and slots.get("date", value) != value:
+                    put("reopen", value)
+                else:
+                    put(name, value)
+        # 준비물·생일자 뒤로 이어지는 라벨 없는 항목 ("준비물 도시락, 물통, 모자")
+        if in_list and not spans:
+            lists[in_list].append(clause)
+            continue
+        in_list = None
+        for pattern in (_PLACE_BEFORE, _PLACE_AT):
+            found = pattern.search(clause)
+            if found:
+                put("place", next(group for group in found.groups() if group))
+                # 장소 뒤의 조사(으로/에서)까지 지워 남은 단어로 세지 않음
+                spans.append(found.span())
+                break
+        leftover.append(_remove(clause, spans))
+    for name, values in lists.items():
+        if values:
+            slots[name] = ", ".join(values)
+    words = [w.strip(".,!?~()[]:") for w in " ".join(leftover).split()]
+    return slots, [w for w in words if w], conflicts
+
+def _meaningful(word: str, ignore: Tuple[str, ...] = ()) -> bool:
+    if word in _FILLER or word in _TRIGGER_WORDS or len(word) <= 1 or _NUMBERISH.fullmatch(word):
+        return False
+    if any(trigger in word for trigger in ignore):
+        return False
+    for particle in _PARTICLES:
+        if word.endswith(particle) and word[:-len(particle)] in _FILLER:
+            return False
+    return True
+
+def _reverses(slots: Dict[str, str], words: List[str]) -> bool:
+    """양식의 뜻을 뒤집는 말이 남은 단어나 칸에 있는지. 준비물 칸은 뺌 ("준비물 없음"은 흔한 안내)."""
+    values = " ".join(value for name, value in slots.items() if name != "items")
+    return any(word in _NEGATIONS or _REVERSAL.search(word) for word in words + values.split())
+
+def render(template: Template, slots: Dict[str, str], use_emoji: bool = True) -> str:
+    """양식을 채웁니다. 빈 칸이 있는 줄은 빼고, 조사는 받침에 맞춥니다."""
+    lines = []
+    for line in template.lines:
+        if any(not slots.get(name) for name in _SLOT.findall(line)):
+            continue
+        if slots.get("date", "").endswith(_BARE_DATES):
+            line = line.replace("{date}에 ", "{date} ")
+        line = _JOSA.sub(lambda m: slots[m.group(1)] + _josa(slots[m.group(1)], m.group(2), m.group(3)), line)
+        line = _SLOT.sub(lambda m: slots[m.group(1)], line)
+        if not use_emoji:
+            line = re.sub(r"\s{2,}", " ", _EMOJI.sub("", line)).strip()
+        lines.append(line)
+    return "\n".join(lines)
+
+def match(keywords: str, use_emoji: bool = True) -> Optional[TemplateMatch]:
+    """키워드가 자주 쓰는 공지에 맞으면 채운 양식을, 아니면 None을 반환합니다.
+
+    의도가 애매하거나, 필수 칸이 비었거나, 한 칸에 서로 다른 값이 둘 이상이거나, 취소·연기·부정처럼 뜻을 뒤집는 말이 있거나,
+    양식에 담기지 않는 단어가 TEMPLATE_MAX_UNUSED_WORDS개(기본 0개)를 넘으면 선생님이 적은
+    내용이 빠지지 않도록 모델 생성에 맡깁니다.
+    """
+    template, trigger = _intent(keywords)
+    if template is None:
+        return None
+    slots, words, conflicts = extract_slots(keywords)
+    if any(not slots.get(name) for name in template.required):
+        return None
+    # 날짜·시간·금액이 둘 이상이면 어느 쪽인지 알 수 없으므로 하나만 있어도 모델로 넘김
+    if conflicts or _reverses(slots, words):
+        return None
+    triggers = tuple(trigger for trigger, _ in _TRIGGERS)
+    if sum(1 for word in words if _meaningful(word, triggers)) > TEMPLATE_MAX_UNUSED_WORDS:
+        return None
+    # "3월 원비"처럼 단어 앞의 달은 제목에 살림
+    month = re.search(rf"(\d{{1,2}})\s*월\s*{re.escape(trigger)}", keywords)
+    slots["topic"] = (f"{month.group(1)}월 " if month else "") + template.triggers[trigger]
+    return TemplateMatch(template.intent, template.label, render(template, slots, use_emoji), slots)
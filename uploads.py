@@ -0,0 +1,216 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple
+import images
+import metrics
+from config import UPLOAD_SPILL_DIR, UPLOAD_SPILL_TTL_SECONDS, IMAGE_WORKERS, IMAGE_DEDUP_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+_sweep_lock = threading.Lock()
+_swept = False
+# 모든 세션이 함께 쓰는 디코딩 스레드 풀: 동시에 펼쳐지는 사진 수를 프로세스 전체에서 IMAGE_WORKERS장으로 제한
+_pool_lock = threading.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+
+def _decode_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="upload")
+        return _pool
+
+def spill_dir() -> str:
+    """원본 사진을 임시로 보관할 폴더를 반환합니다. 처음 부를 때 오래된 파일을 정리합니다."""
+    global _swept
+    path = UPLOAD_SPILL_DIR or os.path.join(tempfile.gettempdir(), "daily-record-uploads")
+    os.makedirs(path, exist_ok=True)
+    with _sweep_lock:
+        if not _swept:
+            _swept = True
+            _sweep(path, UPLOAD_SPILL_TTL_SECONDS)
+    return path
+
+def _sweep(path: str, ttl_seconds: float) -> None:
+    """프로세스가 죽어 남은 임시 파일을 지웁니다."""
+    cutoff = time.time() - ttl_seconds
+    for name in os.listdir(path):
+        file_path = os.path.join(path, name)
+        try:
+            if os.path.getmtime(file_path) < cutoff:
+                os.remove(file_path)
+        except OSError:
+            pass
+
+def _remove_files(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    paths.clear()
+
+@dataclass
+class PreparedPhoto:
+    """업로드 사진 1장: 디스크에 옮긴 원본 경로, 미리보기 썸네일, 전송용 이미지, 중복 판별용 지문."""
+    name: str
+    path: str
+    raw_bytes: int
+    preview: bytes
+    image: Optional[Dict[str, object]]
+    image_bytes: int
+    fingerprint: images.Fingerprint
+
+class UploadSession:
+    """한 세션의 업로드 사진을 관리합니다.
+
+    사진마다 한 번만 디코딩해서 작은 썸네일과 전송용 이미지를 만들고, 원본은 임시 폴더에
+    옮겨 둡니다. Streamlit 재실행 때는 만들어 둔 결과를 그대로 쓰고, 생성이 끝나면
+    전송용 이미지를 놓아 세션에는 썸네일만 남깁니다 (다시 생성할 때 원본에서 다시 만듦).
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or spill_dir()
+        self._photos: "OrderedDict[str, PreparedPhoto]" = OrderedDict()
+        # 읽지 못한 파일은 재실행마다 다시 디코딩하지 않도록 기억
+        self._failed: Dict[str, Exception] = {}
+        self._paths: List[str] = []
+        # 세션이 사라지면 임시 파일도 지움
+        self._finalizer = weakref.finalize(self, _remove_files, self._paths)
+
+    @property
+    def photos(self) -> List[PreparedPhoto]:
+        return list(self._photos.values())
+
+    def sync(self, uploads: Sequence[BinaryIO]) -> List[Tuple[int, Exception]]:
+        """업로더의 현재 파일 목록에 맞춥니다. 새 파일만 처리하고, 빠진 파일은 지웁니다.
+
+        실패한 사진은 (업로드 순서 인덱스, 예외)로 돌려줍니다.
+        """
+        keys = [self._key(upload) for upload in uploads]
+        for key in list(self._photos):
+            if key not in keys:
+                self._discard(key)
+        self._failed = {key: error for key, error in self._failed.items() if key in keys}
+
+        pending = [
+            (idx, key, upload) for idx, (key, upload) in enumerate(zip(keys, uploads))
+            if key not in self._photos and key not in self._failed
+        ]
+        if pending:
+            start = time.perf_counter()
+            outcomes = list(_decode_pool().map(lambda item: self._try_prepare(item[2]), pending))
+            for (idx, key, upload), (photo, error) in zip(pending, outcomes):
+                if error is not None:
+                    logger.warning("사진 %d 전처리 실패: %s", idx + 1, error)
+                    self._failed[key] = error
+                else:
+                    self._photos[key] = photo
+            metrics.record(
+                notice_type="daily",
+                stage="preprocess",
+                preprocess_ms=(time.perf_counter() - start) * 1000,
+                image_count=sum(1 for photo, _ in outcomes if photo is not None),
+                image_errors=sum(1 for _, error in outcomes if error is not None),
+                preprocess_bytes=sum(len(photo.image["data"]) for photo, _ in outcomes if photo is not None)
+            )
+
+        # 업로드 순서 유지
+        order = {key: idx for idx, key in enumerate(keys)}
+        self._photos = OrderedDict(sorted(self._photos.items(), key=lambda item: order[item[0]]))
+        return sorted((order[key], error) for key, error in self._failed.items())
+
+    def select(
+        self,
+        threshold: Optional[int] = IMAGE_DEDUP_THRESHOLD
+    ) -> Tuple[List[PreparedPhoto], List[Tuple[PreparedPhoto, PreparedPhoto]]]:
+        """비슷한 사진 묶음마다 가장 선명한 1장만 고릅니다.
+
+        (보낼 사진 목록, [(뺀 사진, 대신 보내는 사진)])을 반환합니다. threshold가 None이면 모두 보냅니다.
+        """
+        photos = self.photos
+        if threshold is None or len(photos) < 2:
+            return photos, []
+        keep, dropped = set(), []
+        for group in images.group_duplicates([photo.fingerprint.dhash for photo in photos], threshold):
+            best = max(group, key=lambda idx: photos[idx].fingerprint.sharpness)
+            keep.add(best)
+            dropped += [(photos[idx], photos[best]) for idx in group if idx != best]
+        return [photo for idx, photo in enumerate(photos) if idx in keep], dropped
+
+    def model_images(self, photos: Optional[List[PreparedPhoto]] = None) -> List[Dict[str, object]]:
+        """Gemini에 보낼 이미지 목록. 놓아 둔 이미지는 디스크의 원본에서 다시 만듭니다."""
+        result = []
+        for photo in self._photos.values() if photos is None else photos:
+            if photo.image is None:
+                photo.image = images.preprocess_image(photo.path)
+            result.append(photo.image)
+        return result
+
+    def release(self) -> None:
+        """생성이 끝난 뒤 전송용 이미지를 놓습니다 (썸네일과 임시 파일은 유지)."""
+        for photo in self._photos.values():
+            photo.image = None
+
+    def clear(self) -> None:
+        """모든 사진과 임시 파일을 지웁니다."""
+        for key in list(self._photos):
+            self._discard(key)
+        self._failed.clear()
+
+    def memory_bytes(self) -> int:
+        """세션이 메모리에 들고 있는 썸네일·전송용 이미지 용량."""
+        return sum(
+            len(photo.preview) + (len(photo.image["data"]) if photo.image else 0)
+            for photo in self._photos.values()
+        )
+
+    @staticmethod
+    def _key(upload) -> str:
+        # Streamlit UploadedFile은 업로드마다 고유한 file_id를 가짐
+        return getattr(upload, "file_id", None) or f"{getattr(upload, 'name', '')}:{id(upload)}"
+
+    def _try_prepare(self, upload):
+        try:
+            return self._prepare(upload), None
+        except Exception as e:
+            return None, e
+
+    def _prepare(self, upload) -> PreparedPhoto:
+        # 원본은 통째로 복사하지 않고 조각 단위로 디스크에 옮긴 뒤, 파일에서 디코딩
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix=".upload")
+        self._paths.append(path)
+        upload.seek(0)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(upload, f)
+            image, preview, fingerprint = images.preprocess_with_preview(path)
+        except Exception:
+            self._paths.remove(path)
+            _remove_files([path])
+            raise
+        return PreparedPhoto(
+            name=getattr(upload, "name", os.path.basename(path)),
+            path=path,
+            raw_bytes=os.path.getsize(path),
+            preview=preview,
+            image=image,
+            image_bytes=len(image["data"]),
+            fingerprint=fingerprint
+        )
+
+    def _discard(self, key: str) -> None:
+        photo = self._photos.pop(key)
+        try:
+            self._paths.remove(photo.path)
+        except ValueError:
+            pass
+        _remove_files([photo.path])